@@ -0,0 +1,13 @@
+from django.db import models
+
+from django_colortag.index import TagIndexField
+from django_colortag.models import ColorTag
+
+
+class Item(models.Model):
+    title = models.CharField(max_length=50)
+    tag_index = TagIndexField(relation='tags')
+
+
+class ItemTag(ColorTag):
+    items = models.ManyToManyField(Item, related_name='tags')
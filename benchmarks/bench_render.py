@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark comparing the render_as_button() paths.
+
+Run from the repository root: python benchmarks/bench_render.py
+The render cache is disabled, so every call renders the HTML.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+settings.configure(COLORTAG_RENDER_CACHE_SIZE=0)
+django.setup()
+
+from django.test import override_settings
+
+from django_colortag.templatetags.colortag import colortag, colortag_button
+from django_colortag.utils import use_white_font
+
+
+class Tag:
+    is_pinned = False
+
+    def __init__(self, pk, name, color, description):
+        self.id = self.pk = pk
+        self.name = name
+        self.slug = name.lower()
+        self.color = color
+        self.description = description
+        self.font_white = use_white_font(color)
+
+
+TAGS = [
+    Tag(i, 'Tag{}'.format(i), '#{:06x}'.format(i * 40503 % 0xffffff), 'Tag <{}>'.format(i) if i % 2 else '')
+    for i in range(300)
+]
+
+
+def render_all():
+    for tag in TAGS:
+        colortag(tag)
+        colortag(tag, 'size=lg,no_tooltip')
+        colortag_button(tag, 'tooltip_placement=bottom')
+
+
+def main(number=20):
+    results = {}
+    for fast in (False, True):
+        with override_settings(COLORTAG_FAST_RENDER=fast):
+            results[fast] = [
+                [colortag(tag), colortag(tag, 'size=lg,no_tooltip'), colortag_button(tag, 'tooltip_placement=bottom')]
+                for tag in TAGS
+            ]
+            seconds = min(timeit.repeat(render_all, number=number, repeat=5)) / number
+        calls = 3 * len(TAGS)
+        print('{:<10} {:8.1f} us/tag'.format('fast' if fast else 'reference', seconds / calls * 1e6))
+    assert results[False] == results[True], "The renderers produced different HTML"
+
+
+if __name__ == '__main__':
+    main()
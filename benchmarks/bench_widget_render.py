@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark comparing the template and the direct rendering of the
+include/exclude widgets, checking that both produce the same HTML.
+
+Run from the repository root: python benchmarks/bench_widget_render.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django
+
+django.setup()
+
+from django.test import override_settings
+
+from django_colortag.utils import use_white_font
+from django_colortag.widgets import ColortagIEAndOrWidget, ColortagIEMultiWidget
+
+
+class Tag:
+    is_pinned = False
+
+    def __init__(self, pk, name, color, description):
+        self.id = self.pk = pk
+        self.name = name
+        self.slug = 'tag-{}'.format(pk)
+        self.color = color
+        self.description = description
+        self.font_white = use_white_font(color)
+
+
+TAGS = [
+    Tag(i, 'Tag{}'.format(i), '#{:06x}'.format(i * 40503 % 0xffffff), 'Tag <{}>'.format(i) if i % 2 else '')
+    for i in range(300)
+] + [
+    Tag(300, 'A & B <i>"quoted"</i>', '#ff0000', 'Tip & "trick" <b>'),
+    Tag(301, "It's <script>", '#00ff00', "'single'"),
+]
+
+# Nothing selected, and some tags included and excluded
+VALUES = {
+    'unselected': None,
+    'selected': ['I{}'.format(tag.pk) if i % 3 == 1 else 'E{}'.format(tag.pk) if i % 3 == 2 else None
+                 for i, tag in enumerate(TAGS)],
+}
+
+
+def facet_counts():
+    return {tag.pk: tag.pk * 7 % 13 for tag in TAGS[::2]}
+
+
+def multi_widget(compact=False, counts=False, built=False):
+    widget = ColortagIEMultiWidget()
+    widget.compact = compact
+    widget.set_subwidgets(TAGS)
+    if counts:
+        widget.set_facet_counts(facet_counts)
+    if built:
+        # The already built subwidgets are rendered from their attrs
+        widget.widgets
+    return widget
+
+
+def render_multi(value, **options):
+    return str(multi_widget(**options).render('tags', value, {'id': 'id_tags'}))
+
+
+def render_and_or(value, **options):
+    widget = ColortagIEAndOrWidget(choices=TAGS)
+    if options.get('counts'):
+        widget.set_facet_counts(facet_counts)
+    return str(widget.render('tags', [True, value], {'id': 'id_tags'}))
+
+
+CASES = [
+    ('{} {}'.format(label, value_name), render, value, options)
+    for value_name, value in VALUES.items()
+    for label, render, options in (
+        ('multi', render_multi, {}),
+        ('multi built', render_multi, {'built': True}),
+        ('multi counts', render_multi, {'counts': True}),
+        ('multi compact', render_multi, {'compact': True}),
+        ('multi compact counts', render_multi, {'compact': True, 'counts': True}),
+        ('and/or', render_and_or, {}),
+        ('and/or counts', render_and_or, {'counts': True}),
+    )
+]
+
+
+def main(number=5):
+    results = {}
+    for direct in (False, True):
+        with override_settings(COLORTAG_DIRECT_WIDGET_RENDER=direct):
+            # Twice, so that the direct renderer also uses its group cache
+            results[direct] = [
+                [render(value, **options) for name, render, value, options in CASES]
+                for _ in range(2)
+            ]
+
+            def render_all():
+                render_multi(VALUES['selected'])
+            seconds = min(timeit.repeat(render_all, number=number, repeat=5)) / number
+        print('{:<10} {:8.2f} ms/render of {} tags'.format(
+            'direct' if direct else 'templates', seconds * 1e3, len(TAGS),
+        ))
+
+    for run in range(2):
+        for (name, _, _, _), expected, html in zip(CASES, results[False][run], results[True][run]):
+            assert html == expected, "The renderers produced different HTML: {}".format(name)
+    assert results[True][0] == results[True][1], "The cached groups produced different HTML"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Check that the query modes of ColortagIncludeExcludeFilter (joins,
+set_based and index_field) return the same rows for random include/exclude
+combinations with AND and OR.
+
+Run from the repository root: python benchmarks/check_filters.py
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sets up Django with the benchmark settings
+from benchmarks.suite import ROW_TAGS, ItemFilter, create_fixture, tag_list
+from benchmarks.bench_app.models import Item
+
+
+FILTERS = ('tags', 'set_based_tags', 'indexed_tags')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--combinations', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    create_fixture(args.rows)
+    filters = ItemFilter(queryset=Item.objects.all()).filters
+    # One more tag than the tagged ones, which no row has
+    tags = tag_list(ROW_TAGS + 1)
+    rng = random.Random(args.seed)
+
+    mismatches = 0
+    for _ in range(args.combinations):
+        includes = rng.sample(tags, rng.randint(0, 4))
+        excludes = rng.sample(tags, rng.randint(0, 3))
+        conjoined = rng.random() < 0.5
+        results = {
+            name: sorted(
+                filters[name]
+                .filter(Item.objects.all(), (includes, excludes), conjoined=conjoined)
+                .values_list('pk', flat=True)
+            )
+            for name in FILTERS
+        }
+        if any(results[name] != results[FILTERS[0]] for name in FILTERS[1:]):
+            mismatches += 1
+            print('Mismatch: includes {} excludes {} {}: {}'.format(
+                [tag.pk for tag in includes],
+                [tag.pk for tag in excludes],
+                'AND' if conjoined else 'OR',
+                {name: len(pks) for name, pks in results.items()},
+            ), file=sys.stderr)
+
+    print('{} combinations, {} mismatches'.format(args.combinations, mismatches))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
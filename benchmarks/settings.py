@@ -0,0 +1,29 @@
+"""Django settings of the benchmark suite, see benchmarks/suite.py"""
+
+SECRET_KEY = 'benchmarks'
+
+INSTALLED_APPS = [
+    'django.contrib.contenttypes',
+    'django.contrib.auth',
+    'django_filters',
+    'django_colortag',
+    'benchmarks.bench_app',
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+    },
+]
+
+USE_I18N = False
+USE_TZ = True
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
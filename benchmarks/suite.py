@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the rendering, widget and filter hot paths.
+
+Run from the repository root:
+
+    python benchmarks/suite.py              # compare with benchmarks/baseline.json
+    python benchmarks/suite.py --save       # record a new baseline
+    python benchmarks/suite.py -k filter --rows 10000
+
+Each benchmark reports the best time of a run over several repeats, and the
+benchmarks doing queries also the number of queries of a run. The suite fails
+when a time is more than --threshold times its baseline or a query count has
+grown. Times depend on the machine, so record the baseline on the machine
+doing the comparison.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django
+
+django.setup()
+
+import django_filters
+from django import forms
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from benchmarks.bench_app.models import Item, ItemTag
+from django_colortag.fields import ColortagIEAndOrField, ColortagIEField
+from django_colortag.filters import ColortagIncludeExcludeFilter
+from django_colortag.templatetags.colortag import colortag, colortag_button, render_as_button
+from django_colortag.utils import luminance, use_white_font, use_white_font_many
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TAGS = 1000
+# Tags used for tagging the rows of the filter benchmarks
+ROW_TAGS = 20
+
+BENCHMARKS = []
+
+
+def benchmark(name, uses_rows=False, **settings):
+    """
+    Register a benchmark run with the given Django settings. The decorated
+    function sets up the benchmark and returns the function of a single run.
+    """
+    def decorator(setup):
+        BENCHMARKS.append((name, setup, uses_rows, settings))
+        return setup
+    return decorator
+
+
+def create_fixture(rows):
+    with connection.schema_editor() as editor:
+        editor.create_model(Item)
+        editor.create_model(ItemTag)
+    ItemTag.bulk_create_with_slugs([
+        ItemTag(
+            name='Tag {}'.format(i),
+            color='#{:06x}'.format(i * 40503 % 0xffffff),
+            description='Description <{}>'.format(i) if i % 2 else '',
+        )
+        for i in range(TAGS)
+    ])
+    Item.objects.bulk_create((Item(title='Item {}'.format(i)) for i in range(rows)), batch_size=10000)
+
+    rng = random.Random(0)
+    tag_ids = list(ItemTag.objects.order_by('pk').values_list('pk', flat=True)[:ROW_TAGS])
+    Through = ItemTag.items.through
+    Through.objects.bulk_create(
+        (
+            Through(item_id=item_id, itemtag_id=tag_id)
+            for item_id in Item.objects.values_list('pk', flat=True).iterator()
+            for tag_id in rng.sample(tag_ids, rng.randint(0, 3))
+        ),
+        batch_size=10000,
+    )
+    Item._meta.get_field('tag_index').rebuild_index(batch_size=10000)
+
+
+def tag_list(n=300):
+    return list(ItemTag.objects.order_by('pk')[:n])
+
+
+@benchmark('render_as_button x300')
+def bench_render_as_button():
+    tags = tag_list()
+
+    def run():
+        for tag in tags:
+            render_as_button(tag)
+    return run
+
+
+benchmark('render_as_button fast x300', COLORTAG_FAST_RENDER=True)(bench_render_as_button)
+benchmark('render_as_button cached x300', COLORTAG_RENDER_CACHE_SIZE=2048)(bench_render_as_button)
+
+
+@benchmark('colortag filters x300')
+def bench_filters():
+    tags = tag_list()
+
+    def run():
+        for tag in tags:
+            colortag(tag, 'size=lg')
+            colortag_button(tag, 'tooltip_placement=bottom')
+    return run
+
+
+@benchmark('use_white_font x1000')
+def bench_use_white_font():
+    colors = ['#{:06x}'.format(i * 40503 % 0xffffff) for i in range(1000)]
+
+    def run():
+        luminance.cache_clear()
+        for color in colors:
+            use_white_font(color)
+    return run
+
+
+@benchmark('use_white_font_many x1000')
+def bench_use_white_font_many():
+    colors = ['#{:06x}'.format(i * 40503 % 0xffffff) for i in range(1000)]
+
+    def run():
+        luminance.cache_clear()
+        use_white_font_many(colors)
+    return run
+
+
+def bench_widget(n):
+    tags = tag_list(n)
+    data = {'tags_use_and': 'on', 'tags_' + tags[0].slug: 'I' + str(tags[0].pk)}
+    if n > 1:
+        data['tags_' + tags[-1].slug] = 'E' + str(tags[-1].pk)
+
+    class TagForm(forms.Form):
+        tags = ColortagIEAndOrField(ItemTag.objects.none(), required=False)
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.fields['tags'].set_queryset(ItemTag.objects.filter(pk__lte=tags[-1].pk))
+
+    def run():
+        str(TagForm(data)['tags'])
+    return run
+
+
+for _n in (10, 100, 1000):
+    benchmark('ColortagIEAndOrWidget render x{}'.format(_n))(lambda n=_n: bench_widget(n))
+benchmark(
+    'ColortagIEAndOrWidget direct render x1000', COLORTAG_DIRECT_WIDGET_RENDER=True,
+)(lambda: bench_widget(1000))
+
+
+@benchmark('ColortagIEField.clean 10+10')
+def bench_ie_field_clean():
+    tags = tag_list(20)
+    value = ['I{}'.format(tag.pk) for tag in tags[:10]] + ['E{}'.format(tag.pk) for tag in tags[10:]]
+    field = ColortagIEField(ItemTag.objects.all(), required=False)
+
+    def run():
+        field.clean(value)
+    return run
+
+
+class ItemFilter(django_filters.FilterSet):
+    tags = ColortagIncludeExcludeFilter(queryset=ItemTag.objects.all())
+    set_based_tags = ColortagIncludeExcludeFilter(
+        field_name='tags', queryset=ItemTag.objects.all(), set_based=True,
+    )
+    indexed_tags = ColortagIncludeExcludeFilter(
+        field_name='tags', queryset=ItemTag.objects.all(), index_field='tag_index',
+    )
+
+    class Meta:
+        model = Item
+        fields = []
+
+
+def bench_filter(filter_name, conjoined, includes=2, excludes=1):
+    tags = tag_list(ROW_TAGS)
+    values = (tags[:includes], tags[includes:includes + excludes])
+    tag_filter = ItemFilter(queryset=Item.objects.all()).filters[filter_name]
+
+    def run():
+        qs = tag_filter.filter(Item.objects.all(), values, conjoined=conjoined)
+        list(qs.values_list('pk', flat=True))
+    return run
+
+
+# A few tags, and the many tags the set based mode is for
+for _includes, _excludes in ((2, 1), (10, 5)):
+    for _filter_name, _label in (('tags', 'joins'), ('set_based_tags', 'set_based'), ('indexed_tags', 'indexed')):
+        for _conjoined in (False, True):
+            benchmark(
+                'IncludeExcludeFilter {} {}{}'.format(
+                    _label,
+                    'AND' if _conjoined else 'OR',
+                    '' if (_includes, _excludes) == (2, 1) else ' {}+{}'.format(_includes, _excludes),
+                ),
+                uses_rows=True,
+            )(lambda f=_filter_name, c=_conjoined, i=_includes, e=_excludes: bench_filter(f, c, i, e))
+
+
+def measure(run, repeat):
+    with CaptureQueriesContext(connection) as queries:
+        run()
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(number=number, repeat=repeat)) / number
+    return seconds, len(queries.captured_queries)
+
+
+def format_time(seconds):
+    if seconds >= 1e-3:
+        return '{:8.2f} ms'.format(seconds * 1e3)
+    return '{:8.1f} us'.format(seconds * 1e6)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='keyword', help="Run only the benchmarks whose name contains this")
+    parser.add_argument('--rows', type=int, default=100000, help="Rows of the filter fixture")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=1.3,
+                        help="Fail when a time exceeds its baseline by this factor")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help="Record the results as the baseline")
+    args = parser.parse_args(argv)
+
+    selected = [b for b in BENCHMARKS if not args.keyword or args.keyword in b[0]]
+    create_fixture(args.rows if any(b[2] for b in selected) else 0)
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+
+    results = {}
+    failures = []
+    # The render cache is disabled unless a benchmark enables it
+    with override_settings(COLORTAG_RENDER_CACHE_SIZE=0):
+        for name, setup, uses_rows, settings in selected:
+            with override_settings(**settings):
+                seconds, queries = measure(setup(), args.repeat)
+            result = results[name] = {'seconds': seconds, 'queries': queries}
+            if uses_rows:
+                result['rows'] = args.rows
+
+            line = '{:<40} {} {:4d} queries'.format(name, format_time(seconds), queries)
+            base = baseline.get(name)
+            if base is not None and base.get('rows') == result.get('rows'):
+                ratio = seconds / base['seconds']
+                line += '  {:5.2f}x baseline'.format(ratio)
+                if ratio > args.threshold:
+                    failures.append('{}: {:.2f}x slower than the baseline'.format(name, ratio))
+                if queries > base['queries']:
+                    failures.append('{}: {} queries instead of {}'.format(name, queries, base['queries']))
+            print(line)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'benchmarks': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print("Saved the baseline to {}".format(args.baseline))
+
+    for failure in failures:
+        print("REGRESSION " + failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
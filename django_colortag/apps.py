@@ -6,3 +6,9 @@ class ColorTagConfig(AppConfig):
     verbose_name = 'Django Colortag'
 
     required_apps = ('js_jquery_toggle',)
+
+    def ready(self):
+        from . import signals
+        signals.connect_tagged_models()
+        from .index import connect_tag_indexes
+        connect_tag_indexes()
@@ -0,0 +1,157 @@
+import hashlib
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Hashable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+
+
+class LRUCache:
+    """
+    A bounded in-process mapping which forgets the least recently used entries
+    first. Hits and misses are counted so that the cache can be inspected.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: object = None) -> object:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: object) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Remove all entries whose key matches the predicate"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+def _tag_cache():
+    alias = getattr(settings, 'COLORTAG_CHOICE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _version_key(model) -> str:
+    return 'colortag:version:' + model._meta.label
+
+
+def get_tags_version(model) -> Optional[str]:
+    """
+    Return the current version token of the tags of a model, or None if
+    COLORTAG_CHOICE_CACHE is not set. The token changes whenever a tag of the
+    model is saved or deleted.
+    """
+    cache = _tag_cache()
+    if cache is None:
+        return None
+    version = cache.get(_version_key(model))
+    if version is None:
+        cache.add(_version_key(model), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(model))
+    return version
+
+
+def bump_tags_version(model) -> None:
+    cache = _tag_cache()
+    if cache is not None:
+        cache.set(_version_key(model), uuid.uuid4().hex, None)
+
+
+def cached_tag_list(queryset) -> list:
+    """
+    Return the tags of the queryset as a list. When COLORTAG_CHOICE_CACHE is
+    set, the list is shared across requests until the tags of the model
+    change.
+    """
+    if queryset._result_cache is not None or queryset.query.is_empty():
+        return list(queryset)
+    version = get_tags_version(queryset.model)
+    if version is None:
+        return list(queryset)
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return []
+    key = 'colortag:tags:{}:{}:{}'.format(
+        queryset.model._meta.label,
+        version,
+        hashlib.sha1('{}:{}'.format(queryset.db, sql).encode()).hexdigest(),
+    )
+    cache = _tag_cache()
+    tags = cache.get(key)
+    if tags is None:
+        tags = list(queryset)
+        cache.set(key, tags)
+    return tags
+
+
+def cached_result_pks(queryset, tag_model, params: tuple, compute: Callable[[], object]) -> Optional[list]:
+    """
+    Return the pks of the queryset returned by compute(), filtering queryset
+    with params. The pks are shared across requests when
+    COLORTAG_CHOICE_CACHE is set, until the tags of tag_model or the tagged
+    objects of the queryset model change. None if the cache is not used or
+    there are more than COLORTAG_RESULT_CACHE_MAX_SIZE results.
+    """
+    cache = _tag_cache()
+    if cache is None or queryset.query.is_empty():
+        return None
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return None
+    key = 'colortag:results:{}:{}:{}:{}'.format(
+        queryset.model._meta.label,
+        get_tags_version(queryset.model),
+        get_tags_version(tag_model),
+        hashlib.sha1(repr((queryset.db, sql, params)).encode()).hexdigest(),
+    )
+    pks = cache.get(key)
+    if pks is None:
+        limit = getattr(settings, 'COLORTAG_RESULT_CACHE_MAX_SIZE', 10000)
+        pks = list(compute().values_list('pk', flat=True)[:limit + 1])
+        if len(pks) > limit:
+            # Too many for a pk__in lookup, remember not to try again
+            pks = False
+        cache.set(key, pks, getattr(settings, 'COLORTAG_RESULT_CACHE_TIMEOUT', 300))
+    return None if pks is False else pks
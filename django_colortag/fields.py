@@ -1,5 +1,8 @@
+from django.core.exceptions import ValidationError
 from django.forms import models, fields
 
+from .cache import cached_tag_list
+from .instrumentation import instrument
 from .widgets import (
     ColortagSelectMultiple,
     ColortagIEMultiWidget,
@@ -8,12 +11,76 @@ from .widgets import (
 
 
 class ModelChoiceInstanceIterator(models.ModelChoiceIterator):
+    def __iter__(self):
+        if not getattr(self.field, 'cache_choices', False):
+            return super().__iter__()
+        return (self.choice(obj) for obj in self.field.get_tag_list())
+
+    def __len__(self):
+        if not getattr(self.field, 'cache_choices', False):
+            return super().__len__()
+        return len(self.field.get_tag_list())
+
+    def __bool__(self):
+        if not getattr(self.field, 'cache_choices', False):
+            return super().__bool__()
+        return bool(self.field.get_tag_list())
+
     def choice(self, obj):
         # Add the model instance to the iterated items.
         (value, label) = super().choice(obj)
         return (value, label, obj)
 
-class ColortagChoiceField(models.ModelMultipleChoiceField):
+
+class CachedChoicesMixIn:
+    """
+    With cache_choices=True, the tags of the queryset are materialized once
+    per field instance (i.e. per form) and shared by the choices, the widgets
+    and clean(). See django_colortag.cache.cached_tag_list for sharing them
+    across requests.
+    """
+    _tag_list = None
+
+    def __init__(self, *args, cache_choices=False, **kwargs):
+        self.cache_choices = cache_choices
+        super().__init__(*args, **kwargs)
+
+    def __deepcopy__(self, memo):
+        result = super().__deepcopy__(memo)
+        result._tag_list = None
+        return result
+
+    def _set_queryset(self, queryset):
+        self._tag_list = None
+        super()._set_queryset(queryset)
+
+    queryset = property(models.ModelChoiceField._get_queryset, _set_queryset)
+
+    def get_tag_list(self):
+        if self._tag_list is None:
+            self._tag_list = cached_tag_list(self.queryset)
+        return self._tag_list
+
+    def _check_values(self, value):
+        if not self.cache_choices:
+            return super()._check_values(value)
+        key = self.to_field_name or 'pk'
+        try:
+            value = frozenset(value)
+        except TypeError:
+            raise ValidationError(self.error_messages['invalid_list'], code='invalid_list')
+        tags = {str(getattr(tag, key)): tag for tag in self.get_tag_list()}
+        for val in value:
+            if str(val) not in tags:
+                raise ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice',
+                    params={'value': val},
+                )
+        return [tags[str(val)] for val in value]
+
+
+class ColortagChoiceField(CachedChoicesMixIn, models.ModelMultipleChoiceField):
     widget = ColortagSelectMultiple
     iterator = ModelChoiceInstanceIterator
     # The iterator is used in the self.choices property, which is also set to
@@ -24,15 +91,25 @@ class ColortagChoiceField(models.ModelMultipleChoiceField):
         return obj.name
 
 
-class ColortagIEField(models.ModelMultipleChoiceField):
+class ColortagIEField(CachedChoicesMixIn, models.ModelMultipleChoiceField):
     widget = ColortagIEMultiWidget
     iterator = ModelChoiceInstanceIterator
 
     def set_queryset(self, queryset):
         self.queryset = queryset
-        self.widget.set_subwidgets(queryset)
+        self.widget.set_subwidgets(self.get_subwidget_choices())
 
+    def get_subwidget_choices(self):
+        return self.get_tag_list() if self.cache_choices else self.queryset
+
+    @instrument('clean', counts=lambda result, *args: {'tags': len(result[0]) + len(result[1])}, queries=True)
     def clean(self, value):
+        """
+        Return a tuple of the included and the excluded tags as querysets.
+        Both are resolved with a single query against the queryset, and the
+        returned querysets are filled with the resolved tags, so iterating
+        them does not query again.
+        """
         includes = []
         excludes = []
         for v in value:
@@ -42,26 +119,45 @@ class ColortagIEField(models.ModelMultipleChoiceField):
                 includes.append(v[1:])
             elif v[0] == 'E':
                 excludes.append(v[1:])
-        includes_qs = super().clean(includes)
-        excludes_qs = super().clean(excludes)
-        return (includes_qs, excludes_qs)
+        if self.required and (not includes or not excludes):
+            raise ValidationError(self.error_messages['required'], code='required')
+        if not includes and not excludes:
+            return (self.queryset.none(), self.queryset.none())
+
+        key = self.to_field_name or 'pk'
+        tags = {str(getattr(tag, key)): tag for tag in self._check_values(includes + excludes)}
+        for values in (includes, excludes):
+            if values:
+                self.run_validators(values)
+        return (
+            self._resolved_queryset(key, [tags[str(v)] for v in dict.fromkeys(includes)]),
+            self._resolved_queryset(key, [tags[str(v)] for v in dict.fromkeys(excludes)]),
+        )
+
+    def _resolved_queryset(self, key, tags):
+        if not tags:
+            return self.queryset.none()
+        qs = self.queryset.filter(**{key + '__in': [getattr(tag, key) for tag in tags]})
+        # Filled like a prefetch, so evaluating it needs no query
+        qs._result_cache = tags
+        return qs
 
 
 class ColortagIEAndOrField(fields.MultiValueField):
     widget = ColortagIEAndOrWidget
 
-    def __init__(self, queryset, *args, **kwargs):
+    def __init__(self, queryset, *args, cache_choices=False, **kwargs):
         kwargs.setdefault('require_all_fields', False)
         subfields = (
             fields.BooleanField(required=False),
-            ColortagIEField(queryset, required=False)
+            ColortagIEField(queryset, required=False, cache_choices=cache_choices)
         )
         super().__init__(subfields, *args, **kwargs)
 
     def set_queryset(self, queryset):
         self.queryset = queryset
         self.fields[1].queryset = queryset
-        self.widget.set_subwidgets(queryset)
+        self.widget.set_subwidgets(self.fields[1].get_subwidget_choices())
 
     def compress(self, data_list):
         return data_list
@@ -1,12 +1,20 @@
-from django.db.models import Q
+from django.db.models import Count, Exists, OuterRef, Q
 
 import django_filters
+from django_filters.conf import settings as filters_settings
 
+from .cache import cached_result_pks
 from .fields import (
     ColortagChoiceField,
     ColortagIEField,
     ColortagIEAndOrField
 )
+from .instrumentation import instrument, measure_queryset
+
+
+def _count_tags(result, filter, qs, values, *args, **kwargs):
+    includes, excludes = values
+    return {'tags': len(includes) + len(excludes)}
 
 
 class ColortagChoiceFilter(django_filters.ModelMultipleChoiceFilter):
@@ -16,11 +24,91 @@ class ColortagChoiceFilter(django_filters.ModelMultipleChoiceFilter):
 class ColortagIncludeExcludeFilter(django_filters.ModelMultipleChoiceFilter):
     field_class = ColortagIEField
 
+    def __init__(self, *args, set_based=False, facet_counts=False, index_field=None, cache_results=False,
+                 **kwargs):
+        # With set_based=True, the includes and the excludes are each matched
+        # with a single subquery instead of one join per tag.
+        self.set_based = set_based
+        # With index_field, the tags are matched with the TagIndexField of
+        # that name without joins.
+        self.index_field = index_field
+        # With facet_counts=True, the widget shows the number of filtered
+        # results having each tag.
+        self.facet_counts = facet_counts
+        self._facet_counts = None
+        # With cache_results=True, the pks of the results are cached in the
+        # cache of COLORTAG_CHOICE_CACHE and looked up with pk__in.
+        self.cache_results = cache_results
+        super().__init__(*args, **kwargs)
+
+    @property
+    def field(self):
+        new = not hasattr(self, '_field')
+        field = super().field
+        if new and self.facet_counts:
+            field.widget.set_facet_counts(self.get_parent_facet_counts)
+        return field
+
+    def get_facet_counts(self, qs):
+        """
+        Return the number of rows of qs having each tag, as a dict by tag pk.
+        All tags are counted with a single GROUP BY query.
+        """
+        return dict(measure_queryset(
+            qs.order_by()
+            .filter(**{self.field_name + '__isnull': False})
+            .values_list(self.field_name)
+            .annotate(colortag_count=Count('pk', distinct=True))
+            .values_list(self.field_name, 'colortag_count'),
+            'facet_counts',
+        ))
+
+    def get_parent_facet_counts(self):
+        """Return get_facet_counts() of the filtered queryset of the FilterSet"""
+        if self._facet_counts is None:
+            self._facet_counts = self.get_facet_counts(self.parent.qs)
+        return self._facet_counts
+
+    @instrument('filter.build', counts=_count_tags, queries=True)
     def filter(self, qs, values, conjoined=False):
+        """
+        Filter qs by the included and excluded tags. With the instrumentation
+        enabled, building the queryset is measured as 'filter.build' and
+        the query of the returned queryset as 'filter' when it is evaluated.
+        """
         includes, excludes = values
         if not includes and not excludes:
             return qs
 
+        if self.cache_results:
+            params = (
+                self.field_name,
+                self.lookup_expr,
+                sorted(str(getattr(v, 'pk', v)) for v in set(includes)),
+                sorted(str(getattr(v, 'pk', v)) for v in set(excludes)),
+                bool(conjoined),
+            )
+            pks = cached_result_pks(
+                qs, self.get_queryset(self.get_request()).model, params,
+                lambda: self.filter_tags(qs, includes, excludes, conjoined),
+            )
+            if pks is not None:
+                return measure_queryset(qs.filter(pk__in=pks), 'filter')
+
+        return measure_queryset(self.filter_tags(qs, includes, excludes, conjoined), 'filter')
+
+    def filter_tags(self, qs, includes, excludes, conjoined=False):
+        if self.index_field and self.lookup_expr == filters_settings.DEFAULT_LOOKUP_EXPR:
+            field = qs.model._meta.get_field(self.index_field)
+            return qs.filter(field.tag_filter(
+                [getattr(v, 'pk', v) for v in includes],
+                [getattr(v, 'pk', v) for v in excludes],
+                conjoined,
+            ))
+
+        if self.set_based and self.lookup_expr == filters_settings.DEFAULT_LOOKUP_EXPR:
+            return self.filter_set_based(qs, includes, excludes, conjoined)
+
         if not conjoined:
             q = Q()
         for v in set(includes):
@@ -38,6 +126,36 @@ class ColortagIncludeExcludeFilter(django_filters.ModelMultipleChoiceFilter):
 
         return qs.distinct() if self.distinct else qs
 
+    def filter_set_based(self, qs, includes, excludes, conjoined=False):
+        """
+        Filter with one subquery for the included and one for the excluded tags.
+        AND is a GROUP BY with HAVING COUNT(DISTINCT tag) = n, OR is an IN
+        and excludes are a NOT EXISTS. The filtered queryset gets no joins, so
+        it does not need DISTINCT either.
+        """
+        lookup = self.field_name + '__in'
+        tagged = qs.model._base_manager.order_by()
+        include_values = {self.get_filter_predicate(v)[self.field_name] for v in includes}
+        exclude_values = {self.get_filter_predicate(v)[self.field_name] for v in excludes}
+
+        if conjoined and len(include_values) > 1:
+            matching = (
+                tagged.filter(**{lookup: include_values})
+                .values('pk')
+                .annotate(colortag_count=Count(self.field_name, distinct=True))
+                .filter(colortag_count=len(include_values))
+                .values('pk')
+            )
+            qs = qs.filter(pk__in=matching)
+        elif include_values:
+            # An uncorrelated IN subquery, which unlike EXISTS is not run per row on SQLite
+            qs = qs.filter(pk__in=tagged.filter(**{lookup: include_values}).values('pk'))
+
+        if exclude_values:
+            qs = qs.filter(~Exists(tagged.filter(pk=OuterRef('pk'), **{lookup: exclude_values})))
+
+        return qs
+
 
 class ColortagIEAndOrFilter(ColortagIncludeExcludeFilter):
     field_class = ColortagIEAndOrField
@@ -0,0 +1,205 @@
+"""
+Denormalized tag index: a column holding the tag pks of each object, so that
+the include/exclude filters match tags without joining the M2M table.
+
+    class Item(models.Model):
+        tag_index = TagIndexField(relation='tags')
+
+The column is updated on the m2m_changed signals of the relation, when a tag
+is deleted and by django_colortag.views.bulk_create_taggings. Fill it for existing rows with the management command
+colortag_rebuild_index, and filter with
+ColortagIncludeExcludeFilter(index_field='tag_index').
+"""
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from django.apps import apps
+from django.db import models
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+
+try:
+    from django.contrib.postgres.fields import ArrayField
+except ImportError:
+    ArrayField = None
+
+
+class TagIndexMixIn:
+    """The relation handling shared by the tag index fields"""
+
+    def __init__(self, *args, relation: Optional[str] = None, **kwargs):
+        self.relation = relation
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['relation'] = self.relation
+        kwargs.pop('blank', None)
+        kwargs.pop('editable', None)
+        return name, path, args, kwargs
+
+    def encode(self, pks: Iterable[int]) -> object:
+        raise NotImplementedError
+
+    def tag_filter(self, includes: list, excludes: list, conjoined: bool = False) -> Q:
+        """Return the condition matching the included and excluded tag pks"""
+        raise NotImplementedError
+
+    def _resolve_relation(self) -> None:
+        relation = self.model._meta.get_field(self.relation)
+        if relation.concrete:
+            # A ManyToManyField on the model itself
+            m2m = relation
+            self._object_field = m2m.m2m_field_name()
+            self._tag_field = m2m.m2m_reverse_field_name()
+            self._tag_model = m2m.related_model
+        else:
+            # The reverse side of a ManyToManyField on the tag model
+            m2m = relation.field
+            self._object_field = m2m.m2m_reverse_field_name()
+            self._tag_field = m2m.m2m_field_name()
+            self._tag_model = m2m.model
+        self._through = m2m.remote_field.through
+
+    def update_index(self, pks: Iterable[int]) -> None:
+        """Recompute the index of the objects with the given pks"""
+        pks = list(pks)
+        if not pks:
+            return
+        tags = defaultdict(list)
+        rows = (
+            self._through._base_manager
+            .filter(**{self._object_field + '__in': pks})
+            .order_by()
+            .values_list(self._object_field, self._tag_field)
+        )
+        for object_pk, tag_pk in rows:
+            tags[object_pk].append(tag_pk)
+        objs = [self.model(**{'pk': pk, self.attname: self.encode(tags[pk])}) for pk in pks]
+        self.model._base_manager.bulk_update(objs, [self.name])
+
+    def rebuild_index(self, batch_size: int = 1000) -> int:
+        """Recompute the index of all objects, returning their number"""
+        count = 0
+        batch = []
+        for pk in self.model._base_manager.order_by().values_list('pk', flat=True).iterator(chunk_size=batch_size):
+            batch.append(pk)
+            if len(batch) >= batch_size:
+                self.update_index(batch)
+                count += len(batch)
+                batch = []
+        self.update_index(batch)
+        return count + len(batch)
+
+    def _tagged_pks(self, tag) -> list:
+        return list(
+            self._through._base_manager
+            .filter(**{self._tag_field: tag.pk})
+            .values_list(self._object_field, flat=True)
+        )
+
+    def _m2m_changed(self, sender, instance, action, pk_set, **kwargs):
+        if isinstance(instance, self.model):
+            if action in ('post_add', 'post_remove', 'post_clear'):
+                self.update_index([instance.pk])
+        elif action == 'pre_clear':
+            instance._colortag_index_pks = self._tagged_pks(instance)
+        elif action == 'post_clear':
+            self.update_index(instance.__dict__.pop('_colortag_index_pks', ()))
+        elif action in ('post_add', 'post_remove'):
+            self.update_index(pk_set or ())
+
+    def _tag_pre_delete(self, sender, instance, **kwargs):
+        instance._colortag_index_pks = self._tagged_pks(instance)
+
+    def _tag_post_delete(self, sender, instance, **kwargs):
+        self.update_index(instance.__dict__.pop('_colortag_index_pks', ()))
+
+    def connect(self) -> None:
+        self._resolve_relation()
+        uid = 'colortag_index:{}.{}'.format(self.model._meta.label, self.name)
+        m2m_changed.connect(self._m2m_changed, sender=self._through, weak=False, dispatch_uid=uid)
+        pre_delete.connect(self._tag_pre_delete, sender=self._tag_model, weak=False, dispatch_uid=uid)
+        post_delete.connect(self._tag_post_delete, sender=self._tag_model, weak=False, dispatch_uid=uid)
+
+
+class TagIndexField(TagIndexMixIn, models.TextField):
+    """
+    The tag pks as comma delimited text, e.g. ',3,7,12,'. Works on every
+    database, matching each tag with a substring condition.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', '')
+        super().__init__(*args, **kwargs)
+
+    def encode(self, pks):
+        pks = sorted(set(pks))
+        return ',{},'.format(','.join(map(str, pks))) if pks else ''
+
+    def tag_filter(self, includes, excludes, conjoined=False):
+        lookup = self.name + '__contains'
+        q = Q()
+        for pk in includes:
+            condition = Q(**{lookup: ',{},'.format(pk)})
+            q = q & condition if conjoined else q | condition
+        for pk in excludes:
+            q &= ~Q(**{lookup: ',{},'.format(pk)})
+        return q
+
+
+if ArrayField is not None:
+    class TagArrayIndexField(TagIndexMixIn, ArrayField):
+        """
+        The tag pks as a PostgreSQL integer array. Add a GinIndex of the
+        field to Meta.indexes for the containment and overlap conditions.
+        """
+
+        def __init__(self, *args, **kwargs):
+            if not args and 'base_field' not in kwargs:
+                kwargs['base_field'] = models.IntegerField()
+            kwargs.setdefault('default', list)
+            super().__init__(*args, **kwargs)
+
+        def encode(self, pks):
+            return sorted(set(pks))
+
+        def tag_filter(self, includes, excludes, conjoined=False):
+            q = Q()
+            if includes:
+                lookup = '__contains' if conjoined else '__overlap'
+                q &= Q(**{self.name + lookup: sorted(set(includes))})
+            if excludes:
+                q &= ~Q(**{self.name + '__overlap': sorted(set(excludes))})
+            return q
+
+
+def get_tag_index_fields(model_list: Optional[Iterable] = None) -> list:
+    """Return the tag index fields of the models, by default of all models"""
+    return [
+        field
+        for model in (apps.get_models() if model_list is None else model_list)
+        for field in model._meta.concrete_fields
+        if isinstance(field, TagIndexMixIn)
+    ]
+
+
+def update_tag_indexes(through, model, pks: Iterable[int]) -> None:
+    """
+    Recompute the tag index fields of model kept from the through model of
+    their relation, for the objects with the given pks. For changes that
+    send no m2m_changed signal, such as bulk_create of the through model.
+    """
+    pks = list(pks)
+    for field in get_tag_index_fields([model]):
+        if not hasattr(field, '_through'):
+            field._resolve_relation()
+        if field._through is through:
+            field.update_index(pks)
+
+
+def connect_tag_indexes() -> None:
+    for field in get_tag_index_fields():
+        field.connect()
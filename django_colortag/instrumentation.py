@@ -0,0 +1,230 @@
+"""
+Opt-in measurements of the tag rendering, the widgets, the field validation
+and the filters.
+
+Enable with the setting COLORTAG_INSTRUMENTATION = True for the default
+in-memory aggregator, or set it to the dotted path of a Collector subclass.
+Every measurement is passed to the collector and sent as the signal
+`measured`. When disabled, the instrumented functions only check a global.
+"""
+from bisect import bisect_left
+from contextlib import ExitStack
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import Signal, receiver
+from django.utils.module_loading import import_string
+
+
+# Sent with the operation name as the sender and the keyword arguments
+# duration (seconds) and counts (a dict of e.g. tags, queries, cache_hits)
+measured = Signal()
+
+# Upper bounds of the duration histogram buckets in seconds
+HISTOGRAM_BOUNDS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+
+class Collector:
+    """Receives the measurements, see MemoryCollector"""
+
+    def record(self, operation: str, duration: float, counts: dict[str, int]) -> None:
+        raise NotImplementedError
+
+
+class MemoryCollector(Collector):
+    """
+    Aggregate the measurements in memory per operation: the number of calls,
+    the total time, a duration histogram and the totals of the counts.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._operations = {}
+
+    def record(self, operation: str, duration: float, counts: dict[str, int]) -> None:
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = self._operations[operation] = {
+                    'calls': 0,
+                    'time': 0.0,
+                    'histogram': [0] * (len(HISTOGRAM_BOUNDS) + 1),
+                    'counts': {},
+                }
+            stats['calls'] += 1
+            stats['time'] += duration
+            stats['histogram'][bisect_left(HISTOGRAM_BOUNDS, duration)] += 1
+            totals = stats['counts']
+            for name, value in counts.items():
+                totals[name] = totals.get(name, 0) + value
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        Return the statistics of each operation. The histogram is a list of
+        (upper bound in seconds, calls) pairs, the last bound being None.
+        """
+        with self._lock:
+            return {
+                operation: {
+                    'calls': stats['calls'],
+                    'time': stats['time'],
+                    'histogram': list(zip(HISTOGRAM_BOUNDS + (None,), stats['histogram'])),
+                    'counts': dict(stats['counts']),
+                }
+                for operation, stats in self._operations.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations.clear()
+
+
+_UNSET = object()
+_collector = _UNSET
+
+
+def get_collector() -> Optional[Collector]:
+    """Return the collector of the COLORTAG_INSTRUMENTATION setting, or None"""
+    global _collector
+    if _collector is _UNSET:
+        value = getattr(settings, 'COLORTAG_INSTRUMENTATION', False)
+        if value is True:
+            value = MemoryCollector
+        elif isinstance(value, str):
+            value = import_string(value)
+        _collector = value() if value else None
+    return _collector
+
+
+@receiver(setting_changed)
+def _reset_collector(setting, **kwargs):
+    global _collector
+    if setting == 'COLORTAG_INSTRUMENTATION':
+        _collector = _UNSET
+
+
+class _QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def instrument(operation: str,
+               counts: Optional[Callable[..., dict[str, int]]] = None,
+               queries: bool = False,
+               cache: Optional[Callable[[], object]] = None,
+               ):
+    """
+    Measure the calls of the decorated function as the operation. counts is
+    called with the return value and the arguments of the call and returns
+    extra counts. With queries, the SQL queries run during the call are
+    counted. cache returns an LRUCache whose hits during the call are counted
+    (approximately, if the cache is used by other threads at the same time).
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            collector = _collector if _collector is not _UNSET else get_collector()
+            if collector is None:
+                return func(*args, **kwargs)
+            return _measure(collector, operation, func, args, kwargs, counts, queries, cache)
+        return wrapper
+    return decorator
+
+
+def _measure(collector, operation, func, args, kwargs, counts=None, queries=False, cache=None):
+    with ExitStack() as stack:
+        if queries:
+            counter = _QueryCounter()
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+        hits = cache().hits if cache is not None else 0
+        start = perf_counter()
+        result = func(*args, **kwargs)
+        duration = perf_counter() - start
+
+    values = counts(result, *args, **kwargs) if counts is not None else {}
+    if queries:
+        values['queries'] = counter.count
+    if cache is not None:
+        values['cache_hits'] = cache().hits - hits
+    collector.record(operation, duration, values)
+    measured.send(sender=operation, duration=duration, counts=values)
+    return result
+
+
+class MeasuredQuerySetMixIn:
+    """
+    Measures the evaluations, count() and exists() of a queryset and of the
+    querysets derived from it as the operation of the class, counting the
+    rows and the SQL queries. See measure_queryset().
+    """
+    _colortag_operation = None
+    _colortag_base = None
+
+    def _fetch_all(self):
+        collector = get_collector()
+        if self._result_cache is not None or collector is None:
+            return super()._fetch_all()
+        return _measure(
+            collector, self._colortag_operation, super()._fetch_all, (), {},
+            counts=lambda result: {'rows': len(self._result_cache)}, queries=True,
+        )
+
+    def count(self):
+        collector = get_collector()
+        if self._result_cache is not None or collector is None:
+            return super().count()
+        return _measure(collector, self._colortag_operation, super().count, (), {}, queries=True)
+
+    def exists(self):
+        collector = get_collector()
+        if self._result_cache is not None or collector is None:
+            return super().exists()
+        return _measure(collector, self._colortag_operation, super().exists, (), {}, queries=True)
+
+    def __reduce__(self):
+        # Pickled as the plain queryset, the measured classes are not importable
+        return (_unpickle_queryset, (self._colortag_base, self.__getstate__()))
+
+
+def _unpickle_queryset(cls, state):
+    queryset = cls.__new__(cls)
+    queryset.__setstate__(state)
+    return queryset
+
+
+_measured_classes = {}
+
+
+def measure_queryset(queryset, operation: str):
+    """
+    Return a copy of the queryset whose query is measured as the operation
+    when it is evaluated, e.g. by the view showing the results. The queryset
+    is returned as is when the instrumentation is disabled.
+    """
+    if get_collector() is None:
+        return queryset
+    base = queryset.__class__
+    if issubclass(base, MeasuredQuerySetMixIn):
+        if base._colortag_operation == operation:
+            return queryset
+        base = base._colortag_base
+    cls = _measured_classes.get((base, operation))
+    if cls is None:
+        cls = _measured_classes[(base, operation)] = type(base.__name__, (MeasuredQuerySetMixIn, base), {
+            '__module__': base.__module__,
+            '_colortag_operation': operation,
+            '_colortag_base': base,
+        })
+    queryset = queryset._chain()
+    queryset.__class__ = cls
+    return queryset
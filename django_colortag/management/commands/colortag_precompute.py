@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from ...models import PrecomputedColorTag
+
+
+class Command(BaseCommand):
+    help = "Fill the precomputed columns of PrecomputedColorTag models"
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.ModelName',
+                            help="Models to update. By default all PrecomputedColorTag models.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['models']:
+            models = [apps.get_model(label) for label in options['models']]
+        else:
+            models = [
+                model for model in apps.get_models()
+                if issubclass(model, PrecomputedColorTag)
+            ]
+        batch_size = options['batch_size']
+        for model in models:
+            fields = ['font_white', 'badge_html']
+            batch = []
+            count = 0
+            for tag in model._default_manager.iterator(chunk_size=batch_size):
+                tag.update_precomputed()
+                batch.append(tag)
+                if len(batch) >= batch_size:
+                    model._default_manager.bulk_update(batch, fields)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                model._default_manager.bulk_update(batch, fields)
+                count += len(batch)
+            self.stdout.write("{}: updated {} tags".format(model._meta.label, count))
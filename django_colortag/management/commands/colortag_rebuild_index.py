@@ -0,0 +1,19 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from ...index import get_tag_index_fields
+
+
+class Command(BaseCommand):
+    help = "Recompute the tag index fields (TagIndexField) of all rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.ModelName',
+                            help="Models to update. By default all models with a tag index field.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        models = [apps.get_model(label) for label in options['models']] or None
+        for field in get_tag_index_fields(models):
+            count = field.rebuild_index(batch_size=options['batch_size'])
+            self.stdout.write("{}.{}: updated {} rows".format(field.model._meta.label, field.name, count))
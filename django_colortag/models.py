@@ -1,17 +1,144 @@
 import string
 
 from django.db import models
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
 from django.utils.crypto import get_random_string
 from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from colorfield import ColorField
 from functools import total_ordering
 
+from .cache import bump_tags_version
 from .templatetags.colortag import render_as_button
 from .utils import use_white_font
 
 MAX_LENGTH = 20
+# Above this many distinct slug prefixes, bulk_create_with_slugs fetches all
+# slugs of the slug queryset instead of filtering them by prefix
+SLUG_PREFIX_QUERY_LIMIT = 100
+
+
+class TagView:
+    """
+    A lightweight read-only tag, e.g. built from a .values() row without a
+    model instance. It can be rendered everywhere a ColorTag is rendered.
+    """
+    __slots__ = ('id', 'name', 'slug', 'color', 'description', 'font_white', 'is_pinned', 'model')
+
+    def __init__(self, id, name, slug, color, description='', font_white=None, is_pinned=False, model=None):
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.color = color
+        self.description = description
+        self.font_white = use_white_font(color) if font_white is None else font_white
+        self.is_pinned = is_pinned
+        self.model = model
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def _meta(self):
+        # Used for the render cache key, if the model is known
+        if self.model is None:
+            raise AttributeError('_meta')
+        return self.model._meta
+
+    @property
+    def font_color(self):
+        return '#FFF' if self.font_white else '#000'
+
+    def render_as_button(self, **options):
+        return render_as_button(self, options)
+
+    @property
+    def html_button(self):
+        return render_as_button(self)
+
+    @property
+    def html_badge(self):
+        return render_as_button(self, {'static': True})
+
+    def __str__(self):
+        return 'ColorTag({!r}, {!r}, {!r})'.format(
+            self.name, self.slug, self.description
+        )
+
+    def __repr__(self):
+        return '<TagView: {}>'.format(self)
+
+
+class ColorTagQuerySet(models.QuerySet):
+
+    def views(self):
+        """
+        Yield the tags as TagView instances, read with .values_list() without
+        creating model instances.
+        """
+        fields = ['id', 'name', 'slug', 'color', 'description']
+        if any(f.name == 'font_white' for f in self.model._meta.concrete_fields):
+            fields.append('font_white')
+        for values in self.values_list(*fields):
+            yield TagView(*values, model=self.model)
+
+    def attach_to(self, rows, relation, identity_map=None):
+        """
+        Load the tags of the relation of many rows with one instance per
+        distinct tag, shared by all rows. relation is a many-to-many relation
+        or a foreign key of the rows, e.g. 'tags' or 'tag'. The tags are stored
+        as if prefetched, so row.tags.all() and row.tag use them.
+
+        identity_map is an optional dict of tags by primary key. Pass the same
+        dict in all calls during a request to share the tag instances between
+        them. Returns the list of rows.
+        """
+        rows = list(rows)
+        if not rows:
+            return rows
+        if identity_map is None:
+            identity_map = {}
+
+        descriptor = getattr(type(rows[0]), relation)
+        if isinstance(descriptor, ForwardManyToOneDescriptor):
+            attname = descriptor.field.attname
+            tag_ids_by_row = [(getattr(row, attname),) for row in rows]
+        else:
+            manager = getattr(rows[0], relation)
+            through = manager.through
+            source = through._meta.get_field(manager.source_field_name).attname
+            target = through._meta.get_field(manager.target_field_name).attname
+            tag_ids = {row.pk: [] for row in rows}
+            pairs = through._default_manager.filter(**{source + '__in': list(tag_ids)})
+            for row_pk, tag_pk in pairs.values_list(source, target):
+                tag_ids[row_pk].append(tag_pk)
+            tag_ids_by_row = [tag_ids[row.pk] for row in rows]
+
+        all_tag_ids = {pk for pks in tag_ids_by_row for pk in pks if pk is not None}
+        position = {}
+        for i, tag in enumerate(self.filter(pk__in=all_tag_ids)):
+            identity_map.setdefault(tag.pk, tag)
+            position[tag.pk] = i
+
+        for row, pks in zip(rows, tag_ids_by_row):
+            tags = [identity_map[pk] for pk in sorted((pk for pk in pks if pk in position), key=position.get)]
+            if isinstance(descriptor, ForwardManyToOneDescriptor):
+                descriptor.field.set_cached_value(row, tags[0] if tags else None)
+            else:
+                manager = getattr(row, relation)
+                queryset = manager.get_queryset()
+                queryset._result_cache = tags
+                queryset._prefetch_done = True
+                if not hasattr(row, '_prefetched_objects_cache'):
+                    row._prefetched_objects_cache = {}
+                row._prefetched_objects_cache[manager.prefetch_cache_name] = queryset
+        return rows
+
+
+ColorTagManager = models.Manager.from_queryset(ColorTagQuerySet)
 
 
 @total_ordering
@@ -20,6 +147,8 @@ class ColorTag(models.Model):
         abstract = True
         ordering = ['slug']
 
+    objects = ColorTagManager()
+
     name = models.CharField(max_length=MAX_LENGTH, help_text=_("Display name for tag"))
     slug = models.SlugField(max_length=MAX_LENGTH, help_text=_("Slug key for tag. If left blank, one is created from name"))
     description = models.CharField(max_length=155, blank=True, help_text=_("Describe the usage or meaning of this tag"))
@@ -75,19 +204,139 @@ class ColorTag(models.Model):
         """
         return True
 
-    def save(self, *args, update_fields=None, **kwargs):
-        assert self.name, "name is a required parameter"
+    def get_slug_queryset(self):
+        """
+        Return the tags whose slugs must differ from the slug of this tag, or
+        None to check slug candidates with is_valid_slug. With a queryset, the
+        taken slugs are fetched with one query instead of one per candidate.
+        """
+        return None
 
+    def allocate_slug(self, taken_slugs=None):
+        """
+        Return a free slug based on the slug or the name of the tag. Random
+        characters are appended until the slug is valid. taken_slugs is a set
+        of the taken slugs, which is queried if it is not given.
+        """
         slug_candidate = self.slug or slugify(self.name)
+        if taken_slugs is None:
+            queryset = self.get_slug_queryset()
+            if queryset is not None:
+                if self.pk is not None:
+                    queryset = queryset.exclude(pk=self.pk)
+                taken_slugs = set(
+                    queryset.filter(slug__startswith=slug_candidate).values_list('slug', flat=True)
+                )
+        if taken_slugs is None:
+            is_valid_slug = self.is_valid_slug
+        else:
+            is_valid_slug = lambda slug: slug not in taken_slugs
+
         slug_chars = string.ascii_lowercase + string.digits
-        while not self.is_valid_slug(slug_candidate) and len(slug_candidate) < MAX_LENGTH:
+        while not is_valid_slug(slug_candidate) and len(slug_candidate) < MAX_LENGTH:
             slug_candidate += get_random_string(length=1, allowed_chars=slug_chars)
         if len(slug_candidate) >= MAX_LENGTH:
             raise RuntimeError("Unable to find an unique slug")
+        return slug_candidate
+
+    @classmethod
+    def bulk_create_with_slugs(cls, objs, **kwargs):
+        """
+        Allocate unique slugs for the tags and create them with bulk_create.
+        The taken slugs are fetched with one query per distinct slug queryset.
+        """
+        objs = list(objs)
+        groups = {}
+        for obj in objs:
+            assert obj.name, "name is a required parameter"
+            queryset = obj.get_slug_queryset()
+            if queryset is None:
+                obj.slug = obj.allocate_slug()
+            else:
+                groups.setdefault(str(queryset.query), (queryset, []))[1].append(obj)
+
+        for queryset, group in groups.values():
+            prefixes = {obj.slug or slugify(obj.name) for obj in group}
+            if len(prefixes) <= SLUG_PREFIX_QUERY_LIMIT:
+                query = models.Q()
+                for prefix in prefixes:
+                    query |= models.Q(slug__startswith=prefix)
+                queryset = queryset.filter(query)
+            taken_slugs = set(queryset.values_list('slug', flat=True))
+            for obj in group:
+                obj.slug = obj.allocate_slug(taken_slugs)
+                taken_slugs.add(obj.slug)
+
+        created = cls._default_manager.bulk_create(objs, **kwargs)
+        # bulk_create does not send post_save
+        bump_tags_version(cls)
+        return created
+
+    def save(self, *args, update_fields=None, **kwargs):
+        assert self.name, "name is a required parameter"
 
-        self.slug = slug_candidate
+        self.slug = self.allocate_slug()
 
         if update_fields is not None:
             update_fields = tuple(set(update_fields) | {"slug"})
 
         return super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class PrecomputedColorTag(ColorTag):
+    """
+    A ColorTag which stores font_white, and the rendered badge HTML if
+    store_badge_html is set, in columns. Lists can then read them with
+    .only() or .values() and render tags straight from the rows. Columns of
+    existing rows are filled by the management command colortag_precompute.
+    """
+    class Meta(ColorTag.Meta):
+        abstract = True
+
+    store_badge_html = False
+
+    font_white = models.BooleanField(default=False, editable=False)
+    badge_html = models.TextField(blank=True, editable=False)
+
+    @cached_property
+    def html_badge(self):
+        if self.store_badge_html and self.badge_html:
+            return mark_safe(self.badge_html)
+        return render_as_button(self, {'static': True})
+
+    def render_badge_html(self):
+        return render_as_button(self, {'static': True}) if self.store_badge_html else ''
+
+    def update_precomputed(self):
+        """Update the precomputed columns from the other fields"""
+        self.font_white = use_white_font(self.color)
+        for name in ('font_color', 'html_button', 'html_badge'):
+            self.__dict__.pop(name, None)
+        if self.pk is not None:
+            self.badge_html = self.render_badge_html()
+
+    @classmethod
+    def bulk_create_with_slugs(cls, objs, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.update_precomputed()
+        created = super().bulk_create_with_slugs(objs, **kwargs)
+        if cls.store_badge_html:
+            # The badge contains the primary key, known only after the insert
+            rendered = [obj for obj in created if obj.pk is not None]
+            for obj in rendered:
+                obj.badge_html = obj.render_badge_html()
+            cls._default_manager.bulk_update(rendered, ['badge_html'])
+        return created
+
+    def save(self, *args, update_fields=None, **kwargs):
+        self.update_precomputed()
+        if update_fields is not None:
+            update_fields = tuple(set(update_fields) | {'font_white', 'badge_html'})
+        result = super().save(*args, update_fields=update_fields, **kwargs)
+        badge_html = self.render_badge_html()
+        if badge_html != self.badge_html:
+            # The slug or the primary key was set by the save
+            self.badge_html = badge_html
+            type(self)._default_manager.filter(pk=self.pk).update(badge_html=badge_html)
+        return result
@@ -0,0 +1,59 @@
+"""
+Panel for django-debug-toolbar showing the colortag measurements of a request:
+
+    DEBUG_TOOLBAR_PANELS = [..., 'django_colortag.panels.ColortagPanel']
+
+Requires COLORTAG_INSTRUMENTATION to be enabled.
+"""
+from threading import get_ident
+
+from debug_toolbar.panels import Panel
+from django.utils.translation import gettext_lazy as _, ngettext
+
+from .instrumentation import MemoryCollector, get_collector, measured
+
+
+class ColortagPanel(Panel):
+    title = _("Colortags")
+    template = 'django_colortag/debug_toolbar/panel.html'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._collector = MemoryCollector()
+        self._thread = None
+
+    @property
+    def nav_subtitle(self):
+        operations = self.get_stats().get('operations', ())
+        calls = sum(stats['calls'] for stats in operations)
+        return ngettext("%d call", "%d calls", calls) % calls
+
+    def enable_instrumentation(self):
+        self._thread = get_ident()
+        measured.connect(self._measured)
+
+    def disable_instrumentation(self):
+        measured.disconnect(self._measured)
+
+    def _measured(self, sender, duration, counts, **kwargs):
+        # Only the measurements of the thread handling this request
+        if get_ident() == self._thread:
+            self._collector.record(sender, duration, counts)
+
+    def generate_stats(self, request, response):
+        operations = [
+            dict(
+                stats,
+                operation=operation,
+                time=stats['time'] * 1000,
+                histogram=[
+                    ('<= {:g} s'.format(bound) if bound is not None else '> 1 s', calls)
+                    for bound, calls in stats['histogram'] if calls
+                ],
+            )
+            for operation, stats in sorted(self._collector.snapshot().items())
+        ]
+        self.record_stats({
+            'enabled': get_collector() is not None,
+            'operations': operations,
+        })
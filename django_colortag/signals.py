@@ -0,0 +1,59 @@
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .cache import bump_tags_version
+from .models import ColorTag
+from .templatetags.colortag import invalidate_render_cache
+
+
+def colortag_changed(sender, instance, **kwargs):
+    invalidate_render_cache(instance)
+    bump_tags_version(sender)
+
+
+def connect_tagged_models() -> None:
+    """
+    Invalidate the rendered HTML and the cached tags of each ColorTag model
+    when its tags are saved or deleted. Bump the tags version of the models
+    tagged with ColorTags when their taggings change or their objects are
+    saved or deleted, which invalidates the cached filter results of these
+    models. The taggings are the many-to-many relations of the tags and the
+    models with a foreign key to a tag, whose other foreign keys point to
+    the tagged objects.
+    """
+    for model in apps.get_models():
+        if not issubclass(model, ColorTag):
+            continue
+        uid = 'colortag_changed:{}'.format(model._meta.label)
+        post_save.connect(colortag_changed, sender=model, dispatch_uid=uid)
+        post_delete.connect(colortag_changed, sender=model, dispatch_uid=uid)
+        for field in model._meta.get_fields():
+            if not field.many_to_many:
+                continue
+            tagged = field.related_model
+            through = field.remote_field.through if field.concrete else field.through
+
+            def tagged_changed(sender, tagged=tagged, **kwargs):
+                bump_tags_version(tagged)
+
+            uid = 'colortag_tagged:{}.{}'.format(model._meta.label, field.name)
+            m2m_changed.connect(tagged_changed, sender=through, weak=False, dispatch_uid=uid)
+            post_save.connect(tagged_changed, sender=tagged, weak=False, dispatch_uid=uid)
+            post_delete.connect(tagged_changed, sender=tagged, weak=False, dispatch_uid=uid)
+
+        for field in model._meta.get_fields():
+            if not field.one_to_many:
+                continue
+            tagging = field.related_model
+            tagged = [tagging] + [
+                f.related_model for f in tagging._meta.concrete_fields
+                if f.many_to_one and f.related_model is not model
+            ]
+
+            def tagging_changed(sender, tagged=tagged, **kwargs):
+                for tagged_model in tagged:
+                    bump_tags_version(tagged_model)
+
+            uid = 'colortag_tagging:{}.{}'.format(model._meta.label, field.name)
+            post_save.connect(tagging_changed, sender=tagging, weak=False, dispatch_uid=uid)
+            post_delete.connect(tagging_changed, sender=tagging, weak=False, dispatch_uid=uid)
@@ -4,12 +4,30 @@ const get_create_tagging_dropdown_closure = (function ($) {
     *        e.g. 'https://plus.cs.hut.fi/api/v2/courses/1'.
     * @param {String} options.api_taggings_url - suffix for taggings, default /taggings/
     * @param {String} options.api_tags_url - suffix for tags, default /usertags/
+    * @param {String} options.api_bulk_taggings_url - suffix for a bulk tagging
+    *        endpoint (see django_colortag.views.BulkTaggingView). When set,
+    *        users are tagged in batches instead of one request per user.
+    * @param {Int} options.bulk_batch_size - user ids per batch, default 500
+    * @param {Int} options.bulk_concurrency - concurrent batch requests, default 2
+    * @param {String} options.api_tag_search_url - suffix for a tag search
+    *        endpoint (see django_colortag.views.TagSearchView). When set, the
+    *        dropdown searches the tags as the user types instead of
+    *        downloading all tags.
+    * @param {Int} options.search_debounce - milliseconds to wait for more
+    *        typing before searching, default 250
+    * @param {String} options.search_placeholder - placeholder of the search field
     * TODO: replace 'options' with object destructuring when supported by browsers.
     */
   return function get_create_tagging_dropdown_closure(options) {
     const default_settings = {
       api_taggings_url: 'taggings/',
       api_tags_url: 'usertags/',
+      api_bulk_taggings_url: undefined,
+      bulk_batch_size: 500,
+      bulk_concurrency: 2,
+      api_tag_search_url: undefined,
+      search_debounce: 250,
+      search_placeholder: 'Search tags',
     }
     // TODO: replace with spread syntax (ES2018) when supported by browsers
     const settings = $.extend({}, default_settings, options);
@@ -42,11 +60,57 @@ const get_create_tagging_dropdown_closure = (function ($) {
      * Tag several users at once
      */
     function add_taggings(user_ids, tag_slug) {
+      if (typeof settings.api_bulk_taggings_url === 'string') {
+        return add_taggings_in_batches(user_ids, tag_slug);
+      }
       return user_ids.map(function (user_id) {
         return add_tagging(user_id, tag_slug);
       });
     }
 
+    /**
+     * Send AJAX post requests to the bulk tagging endpoint, each containing
+     * at most bulk_batch_size user ids. At most bulk_concurrency requests are
+     * in flight at a time. Returns a promise for each batch.
+     */
+    function add_taggings_in_batches(user_ids, tag_slug) {
+      const url = settings.api_url + settings.api_bulk_taggings_url;
+      const batches = [];
+      for (let i = 0; i < user_ids.length; i += settings.bulk_batch_size) {
+        batches.push(user_ids.slice(i, i + settings.bulk_batch_size));
+      }
+      const deferreds = batches.map(function () {
+        return $.Deferred();
+      });
+      let next = 0;
+      function send_next() {
+        if (next >= batches.length) {
+          return;
+        }
+        const i = next++;
+        $.ajax({
+          type: 'POST',
+          url: url,
+          data: JSON.stringify({
+            tag: { slug: tag_slug },
+            // The endpoint accepts only JSON integers, ids read from the page may be strings
+            ids: batches[i].map(Number),
+          }),
+          contentType: 'application/json; charset=utf-8',
+          dataType: 'json',
+        })
+          .done(function () { deferreds[i].resolveWith(this, arguments); })
+          .fail(function () { deferreds[i].rejectWith(this, arguments); })
+          .always(send_next);
+      }
+      for (let k = 0; k < settings.bulk_concurrency; k++) {
+        send_next();
+      }
+      return deferreds.map(function (deferred) {
+        return deferred.promise();
+      });
+    }
+
     /**
      * Return f iff it is defined, and a do-nothing function otherwise
      */
@@ -65,6 +129,83 @@ const get_create_tagging_dropdown_closure = (function ($) {
       });
     }
 
+    // Cache search responses by page and query, shared by all dropdowns
+    const search_cache = {};
+    function search_tags(query, page) {
+      const key = page + ':' + query;
+      if (!search_cache[key]) {
+        search_cache[key] = $.ajax({
+          type: 'GET',
+          url: settings.api_url + settings.api_tag_search_url,
+          data: { q: query, page: page },
+          dataType: 'json',
+        }).fail(function () {
+          delete search_cache[key];
+        });
+      }
+      return search_cache[key];
+    }
+
+    /**
+     * Add a search field to the dropdown menu $ul, listing the tags matching
+     * the typed text one page at a time. The first page is fetched when the
+     * dropdown is first opened.
+     */
+    function add_search($span, $ul, tag_item, exclude_tag_ids) {
+      const $search = $('<input />')
+        .addClass('form-control form-control-sm')
+        .attr({
+          'type': 'search',
+          'placeholder': settings.search_placeholder,
+          'aria-label': settings.search_placeholder,
+        })
+        // Keep the dropdown open when the field is clicked
+        .on('click', function (event) {
+          event.stopPropagation();
+        });
+      const $search_li = $('<li />').addClass('px-2').append($search);
+      $ul.append($search_li);
+
+      let latest_query = null;
+      function show(query, page) {
+        latest_query = query;
+        search_tags(query, page).done(function (data) {
+          if (query !== latest_query) {
+            return; // a response to an older query
+          }
+          if (page === 1) {
+            $ul.children().not($search_li).remove();
+          } else {
+            $ul.children('.colortag-search-more').remove();
+          }
+          $ul.append(data.results.filter(function (tag) {
+            return exclude_tag_ids.indexOf(tag.id) === -1;
+          }).map(tag_item));
+          if (data.next) {
+            const $more = $('<a />')
+              .attr({ href: '#' })
+              .text('\u2026')
+              .on('click', function () {
+                show(query, data.next);
+                return false;
+              });
+            $ul.append($('<li />').addClass('colortag-search-more').append($more));
+          }
+        });
+      }
+
+      let timer;
+      $search.on('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+          show($search.val().trim(), 1);
+        }, settings.search_debounce);
+      });
+      $span.one('show.bs.dropdown', function () {
+        show('', 1);
+      });
+    }
+
     /**
      * Create a dropdown menu for adding new taggings
      *
@@ -90,26 +231,32 @@ const get_create_tagging_dropdown_closure = (function ($) {
 
       const slug_id_prefix = 'tag-';
 
-      const click_handler_for_slug = function (tag_slug) {
+      const search = typeof settings.api_tag_search_url === 'string';
+
+      const click_handler_for_tag = function (tag) {
+        const tag_slug = tag.slug;
         return function (event) {
           const user_ids = get_users();
-          click_callback(add_taggings(user_ids, tag_slug), tags_xhr());
+          // In the search mode, the callback gets the clicked tag instead of all tags
+          const tags = search ? $.Deferred().resolve({ results: [tag] }).promise() : tags_xhr();
+          click_callback(add_taggings(user_ids, tag_slug), tags);
           const tag_elem_id = slug_id_prefix + tag_slug;
           $('button#' + button_id + ' + ul > li#' + tag_elem_id).remove();
           return false;
         }
       }
 
-      // Get the list of all tags and filter out excluded ones
-      tags_xhr().done(function (data) {
-        const all_tags = data.results;
-        const tags = all_tags.filter(function (tag) {
-          // true if tag.id is not null and it is not in exclude_tag_ids.
-          // TODO: replace with Array.includes once IE is no longer relevant
-          return tag.id !== null && exclude_tag_ids.indexOf(tag.id) === -1;
-        });
+      const tag_item = function (tag) {
+        const $li = $('<li />').attr({ 'id': slug_id_prefix + tag.slug });
+        const $a = $('<a />')
+          .attr({ href: '#' })
+          .append(django_colortag_badge(tag))
+          .on('click', click_handler_for_tag(tag));
+        $li.append($a);
+        return $li;
+      };
 
-        // Construct the dropdown
+      const create_dropdown = function () {
         const $span = $('<span />').addClass('dropdown create-tagging');
         const $button = $('<button />')
           .addClass('btn btn-default dropdown-toggle')
@@ -125,20 +272,31 @@ const get_create_tagging_dropdown_closure = (function ($) {
         const $ul = $('<ul />')
           .addClass('dropdown-menu')
           .attr({ 'aria-labeledby': button_id });
-        const $li_list = tags.map(function (tag) {
-          const $li = $('<li />').attr({ 'id': slug_id_prefix + tag.slug });
-          const $a = $('<a />')
-            .attr({ href: '#' })
-            .append(django_colortag_badge(tag))
-            .on('click', click_handler_for_slug(tag.slug));
-          $li.append($a);
-          return $li;
-        });
-
-        $ul.append($li_list);
         $span.append($button);
         $span.append($ul);
-        menu_created_callback($span);
+        return $ul;
+      };
+
+      if (search) {
+        // The dropdown is created right away and searches tags when opened
+        const $ul = create_dropdown();
+        add_search($ul.parent(), $ul, tag_item, exclude_tag_ids);
+        menu_created_callback($ul.parent());
+        return;
+      }
+
+      // Get the list of all tags and filter out excluded ones
+      tags_xhr().done(function (data) {
+        const all_tags = data.results;
+        const tags = all_tags.filter(function (tag) {
+          // true if tag.id is not null and it is not in exclude_tag_ids.
+          // TODO: replace with Array.includes once IE is no longer relevant
+          return tag.id !== null && exclude_tag_ids.indexOf(tag.id) === -1;
+        });
+
+        const $ul = create_dropdown();
+        $ul.append(tags.map(tag_item));
+        menu_created_callback($ul.parent());
       });
     }
   }
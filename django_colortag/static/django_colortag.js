@@ -34,7 +34,7 @@ function django_colortag_badge(colortag, options_) {
     classes.push('badge', 'badge-' + (options['size'] || 'xs'));
   }
   if (options['class']) {
-    classes.push(options['class'].split(' '));
+    classes.push(...options['class'].split(' '));
   }
   attrs['class'] = classes.join(' ');
   attrs['style'] = '--colortag-color: ' + colortag.color + ';';
@@ -43,14 +43,38 @@ function django_colortag_badge(colortag, options_) {
     attrs['data-tag' + k] = colortag['data-attrs'][k];
   }
 
-  const attr_strings = Object.keys(attrs).map(function (k) {
-    return k + '="' + attrs[k] + '"';
-  });
-  const flatatt = attr_strings.join(' ');
+  // The element is built with attr() and text(), which escape the values:
+  // the tags may come from a JSON catalog instead of escaped server HTML
+  const elem = /^[a-z][a-z0-9]*$/i.test(options['element']) ? options['element'] : 'span';
+  return $(document.createElement(elem)).attr(attrs).text(colortag.name);
+}
 
-  const elem = options['element']
-  const html = '<' + elem + ' ' + flatatt + '>' + colortag.name + '</' + elem + '>';
-  return $(html);
+/**
+ * Replace the placeholders rendered by the colortag_refs template tag with
+ * badges of the tags in the JSON catalog served by TagCatalogView. The
+ * catalog is fetched once per call and cached by the browser.
+ */
+function django_colortag_expand(catalog_url, root) {
+  return jQuery.getJSON(catalog_url).done(function (data) {
+    const tags = {};
+    data.tags.forEach(function (tag) {
+      tags[tag.id] = tag;
+    });
+    jQuery(root || document).find('.colortag-ref').each(function () {
+      const tag = tags[this.getAttribute('data-tagid')];
+      if (!tag) {
+        return;
+      }
+      const options = {};
+      (this.getAttribute('data-options') || '').split(',').forEach(function (option) {
+        if (option) {
+          const parts = option.split('=');
+          options[parts[0]] = parts.length > 1 ? parts.slice(1).join('=') : true;
+        }
+      });
+      jQuery(this).replaceWith(django_colortag_badge(tag, options));
+    });
+  });
 }
 
 function django_colortag_choice() {
@@ -64,33 +88,132 @@ function django_colortag_choice() {
 	});
 }
 
-function selectNextOption(e, increment = 1) {
-  const group = e.currentTarget;
+function selectNextOption(e, increment = 1, group = e.currentTarget) {
   const child_inputs = group.querySelectorAll("input");
   const checked_i = Array.prototype.findIndex.call(child_inputs, (elem) => elem.checked);
   const next = child_inputs[(checked_i + increment) % 3];
   next.checked = true;
+  next.dispatchEvent(new Event('change', { bubbles: true }));
   next.focus({ focusVisible: (e.type == "keydown")});
   e.preventDefault();
 }
 
-window.addEventListener("load", (event) => {
-  /* Set up toggling between colortag include-exclude states */
-  const groups = document.querySelectorAll(".colortag-inc-exc");
-  for (const g of groups) {
-    g.addEventListener('click', selectNextOption);
-    g.addEventListener('keydown', function(e) {
-      if(e.keyCode == 13 || e.keyCode == 32) {
-          selectNextOption(e);
+/**
+ * Filter the rows already on the page by the tags selected in the
+ * include/exclude widgets inside root (e.g. the filter form), with the same
+ * AND/OR and exclude rules as ColortagIEAndOrFilter but without requests.
+ * The tags of a row are the data-tagid attributes of the tag badges in it.
+ * Returns {refresh, apply}, or null if there are more than options.max_rows
+ * rows, which are better left to the server side filtering.
+ */
+function django_colortag_instant_filter(root, rows_selector, options_) {
+  const options = jQuery.extend({
+    max_rows: 5000,
+    tag_selector: '.colortag[data-tagid]',
+  }, options_);
+  root = typeof root === 'string' ? document.querySelector(root) : root;
+  let rows = [];
+  let row_tags = [];
+
+  function refresh() {
+    rows = Array.from(document.querySelectorAll(rows_selector));
+    row_tags = rows.map((row) => new Set(Array.from(
+      row.querySelectorAll(options.tag_selector),
+      (badge) => badge.getAttribute('data-tagid')
+    )));
+  }
+
+  function apply() {
+    const includes = [];
+    const excludes = [];
+    for (const input of root.querySelectorAll('.colortag-inc-exc input:checked')) {
+      if (input.value[0] == 'I') {
+        includes.push(input.value.slice(1));
+      } else if (input.value[0] == 'E') {
+        excludes.push(input.value.slice(1));
       }
-   });
-   g.addEventListener('contextmenu', (e) => selectNextOption(e, 2));
+    }
+    const use_and = root.querySelector('.and-or input[value="true"]:checked') !== null;
+    rows.forEach((row, i) => {
+      const tags = row_tags[i];
+      const has = (tag) => tags.has(tag);
+      const included = includes.length == 0 || (use_and ? includes.every(has) : includes.some(has));
+      row.hidden = !included || excludes.some(has);
+    });
+  }
+
+  refresh();
+  if (rows.length > options.max_rows) {
+    return null;
+  }
+  root.addEventListener('change', (e) => {
+    if (e.target instanceof Element && e.target.closest('.colortag-inc-exc, .and-or')) {
+      apply();
+    }
+  });
+  apply();
+  return { refresh: refresh, apply: apply };
+}
+
+/**
+ * Create the Bootstrap tooltip or popover of an element when it is first
+ * interacted with, instead of creating one for every element on page load.
+ * Shows it right away if the event is one of its triggers, as the instance
+ * has missed that event.
+ */
+function django_colortag_lazy_toggle(e) {
+  if (!window.bootstrap || !(e.target instanceof Element)) {
+    return;
+  }
+  const elem = e.target.closest('[data-bs-toggle="tooltip"], [data-bs-toggle="popover"]');
+  if (!elem) {
+    return;
   }
+  const is_popover = elem.getAttribute('data-bs-toggle') == 'popover';
+  const Component = is_popover ? bootstrap.Popover : bootstrap.Tooltip;
+  if (Component.getInstance(elem)) {
+    return;
+  }
+  let instance;
+  try { instance = new Component(elem); } catch (_) { return; }
+  const triggers = (elem.getAttribute('data-bs-trigger') || (is_popover ? 'click' : 'hover focus')).split(' ');
+  const trigger = {mouseover: 'hover', focusin: 'focus', click: 'click'}[e.type];
+  if (triggers.includes(trigger)) {
+    if (trigger == 'click') {
+      instance.toggle();
+    } else {
+      instance.show();
+    }
+  }
+}
 
-  // Bootstrap 5 popover initialization with jQuery
-  $('[data-bs-toggle="popover"]').each(function() {
-    if (this) {
-      try { new bootstrap.Popover(this); } catch (_) {}
+/* Set up toggling between colortag include-exclude states with listeners
+ * delegated from the document, so that no work is done per tag on load */
+function django_colortag_delegate(type, handler) {
+  document.addEventListener(type, function(e) {
+    const group = e.target instanceof Element ? e.target.closest(".colortag-inc-exc") : null;
+    if (group) {
+      handler(e, group);
     }
   });
+}
+
+django_colortag_delegate('click', (e, group) => selectNextOption(e, 1, group));
+django_colortag_delegate('keydown', function(e, group) {
+  if(e.keyCode == 13 || e.keyCode == 32) {
+    selectNextOption(e, 1, group);
+  }
 });
+django_colortag_delegate('contextmenu', (e, group) => selectNextOption(e, 2, group));
+
+/* Instant filtering of the forms with a data-colortag-instant attribute,
+ * whose value selects the rows to filter */
+document.addEventListener('DOMContentLoaded', () => {
+  for (const form of document.querySelectorAll('[data-colortag-instant]')) {
+    django_colortag_instant_filter(form, form.getAttribute('data-colortag-instant'));
+  }
+});
+
+document.addEventListener('mouseover', django_colortag_lazy_toggle);
+document.addEventListener('focusin', django_colortag_lazy_toggle);
+document.addEventListener('click', django_colortag_lazy_toggle);
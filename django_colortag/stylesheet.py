@@ -0,0 +1,31 @@
+import hashlib
+import re
+from typing import Iterable
+
+# Only plain color codes and class names are written to the stylesheet
+_COLOR_RE = re.compile(r'^#[0-9a-fA-F]{3,8}$')
+_CLASS_RE = re.compile(r'^[\w-]+$')
+
+
+def tag_class(colortag: "ColorTag") -> str:
+    """Return the class of a tag in the generated stylesheet"""
+    return 'ct-{}'.format(colortag.pk)
+
+
+def render_stylesheet(tags: Iterable["ColorTag"]) -> str:
+    """
+    Return CSS setting the color of each tag for the compact rendering, in
+    which the badges only have the class of the tag instead of a style.
+    """
+    rules = []
+    for tag in tags:
+        color = str(tag.color)
+        class_name = tag_class(tag)
+        if _COLOR_RE.match(color) and _CLASS_RE.match(class_name):
+            rules.append('.{}{{--colortag-color:{}}}\n'.format(class_name, color))
+    return ''.join(rules)
+
+
+def stylesheet_version(css: str) -> str:
+    """Return the content hash of a stylesheet, used in its ETag and URL"""
+    return hashlib.sha1(css.encode()).hexdigest()[:16]
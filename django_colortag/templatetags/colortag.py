@@ -1,66 +1,384 @@
-from typing import Optional
+import hashlib
+from functools import lru_cache
+from itertools import chain
+from types import MappingProxyType
+from typing import Iterable, Optional
 
 from django import template
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.forms.utils import flatatt
-from django.utils.html import format_html
+from django.utils.html import conditional_escape, escape, format_html, format_html_join
+from django.utils.safestring import mark_safe
 
-from ..widgets import get_colortag_attrs, get_colortag_classes
+from ..cache import LRUCache
+from ..instrumentation import instrument
+from ..stylesheet import render_stylesheet, stylesheet_version, tag_class
 
 
 register = template.Library()
 
 
+# Rendered HTML of tags, keyed by the tag content and the rendering options.
+# Configure with the settings COLORTAG_RENDER_CACHE_SIZE (0 disables the cache)
+# and COLORTAG_RENDER_CACHE_BACKEND (alias of a Django cache backing the LRU).
+_render_cache = None
+# Setting COLORTAG_FAST_RENDER selects the single-pass string renderer
+_fast_render = None
+
+
+def get_render_cache() -> LRUCache:
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = LRUCache(getattr(settings, 'COLORTAG_RENDER_CACHE_SIZE', 2048))
+    return _render_cache
+
+
+def use_fast_render() -> bool:
+    global _fast_render
+    if _fast_render is None:
+        _fast_render = bool(getattr(settings, 'COLORTAG_FAST_RENDER', False))
+    return _fast_render
+
+
+@receiver(setting_changed)
+def _reset_render_cache(setting, **kwargs):
+    global _render_cache, _fast_render
+    if setting.startswith('COLORTAG_RENDER_CACHE'):
+        _render_cache = None
+    elif setting == 'COLORTAG_FAST_RENDER':
+        _fast_render = None
+
+
+def _model_label(colortag: "ColorTag") -> Optional[str]:
+    meta = getattr(colortag, '_meta', None)
+    return meta.label if meta is not None else None
+
+
+def _render_cache_key(colortag: "ColorTag", options: "ButtonOptions") -> Optional[tuple]:
+    try:
+        key = (
+            _model_label(colortag),
+            colortag.pk,
+            colortag.name,
+            colortag.slug,
+            colortag.color,
+            colortag.description,
+            colortag.font_white,
+            colortag.is_pinned,
+            tuple(sorted(getattr(colortag, 'data_attrs', {}).items())),
+            options.key,
+        )
+        hash(key)
+    except TypeError:
+        # Unhashable option or data attribute values are rendered uncached
+        return None
+    return key
+
+
+def invalidate_render_cache(colortag: "ColorTag") -> None:
+    """
+    Drop the cached HTML of a tag from the local cache. Entries in the Django
+    cache backend are keyed by the tag content, so they can not go stale and
+    are left to expire.
+    """
+    label, pk = _model_label(colortag), colortag.pk
+    get_render_cache().discard(lambda key: key[1] == pk and key[0] == label)
+
+
+class ButtonOptions:
+    """
+    Options of render_as_button resolved once per option set. Holds the class
+    strings and tooltip attributes which do not depend on the tag itself.
+    """
+    __slots__ = ('key', 'options', 'element', 'tooltip', 'compact', '_class_strings', '_templates')
+
+    def __init__(self, extra: tuple[tuple[str, object], ...] = (), active: bool = False) -> None:
+        options = {
+            'active': active,
+            'element': 'span',
+            # 'tooltip_trigger': 'hover',
+            # 'tooltip_placement': 'top',
+            # 'size': 'xs',
+            'badge': True,
+            'button': True,
+        }
+        options.update(extra)
+
+        if options.get('static'):
+            options['active'] = True
+            options['button'] = False
+
+        self.key = tuple(sorted(options.items()))
+        self.options = MappingProxyType(options)
+        self.element = options['element']
+        # The compact rendering leaves the color to the generated stylesheet
+        self.compact = bool(options.get('compact'))
+        if options.get('no_tooltip'):
+            self.tooltip = None
+        else:
+            self.tooltip = {
+                'data-bs-toggle': 'tooltip',
+                'data-bs-trigger': options.get('tooltip_trigger', 'hover'),
+                'data-bs-placement': options.get('tooltip_placement', 'top'),
+            }
+
+        # Same classes as get_colortag_classes(), in a stable order
+        option_classes = []
+        if options.get('active'):
+            option_classes.append('colortag-active')
+        if options.get('button'):
+            option_classes.append('btn')
+        if options.get('badge'):
+            option_classes.extend(('badge', 'badge-{}'.format(options.get('size', 'xs'))))
+        if options.get('class'):
+            option_classes.extend(options['class'].split(' '))
+        self._class_strings = {
+            (font_white, pinned): ' '.join(dict.fromkeys(chain(
+                ('colortag', 'colortag-dark' if font_white else 'colortag-light'),
+                ('pinned',) if pinned else (),
+                option_classes,
+            )))
+            for font_white in (False, True)
+            for pinned in (False, True)
+        }
+        self._templates = self._compile_templates()
+
+    def _compile_templates(self) -> Optional[tuple[str, str]]:
+        """
+        Return %-format templates of the whole element without and with a
+        tooltip, producing the same attribute order and escaping as flatatt.
+        None if some option would need the generic rendering path.
+        """
+        tooltip = self.tooltip or {}
+        if self.compact:
+            return None
+        if not all(isinstance(v, str) for v in chain((self.element,), tooltip.values())):
+            return None
+
+        def quote(value):
+            return conditional_escape(value).replace('%', '%%')
+
+        element = quote(self.element)
+        head = '<' + element + '  class="%s" data-background="%s"'
+        tail = ' data-tagid="%s" data-tagslug="%s" style="--colortag-color: %s; "'
+        plain = head + tail + '>%s</' + element + '>'
+        if not tooltip:
+            return (plain, None)
+        tooltip_attrs = ''.join(
+            ' {}="{}"'.format(k, quote(v)) for k, v in sorted(tooltip.items())
+        )
+        return (plain, head + tooltip_attrs + tail + ' title="%s">%s</' + element + '>')
+
+    def class_string(self, colortag: "ColorTag") -> str:
+        classes = self._class_strings[(bool(colortag.font_white), bool(colortag.is_pinned))]
+        if self.compact:
+            return classes + ' ' + tag_class(colortag)
+        return classes
+
+
+@lru_cache(maxsize=256)
+def _compile_options(extra: tuple[tuple[str, object], ...], active: bool) -> ButtonOptions:
+    return ButtonOptions(extra, active)
+
+
+def compile_options(extra=(), active: bool = False) -> ButtonOptions:
+    """Return the shared ButtonOptions of a dict or a tuple of options"""
+    if isinstance(extra, dict):
+        extra = tuple(extra.items())
+    try:
+        return _compile_options(extra, bool(active))
+    except TypeError:
+        # Unhashable option values can not be shared
+        return ButtonOptions(extra, active)
+
+
+@lru_cache(maxsize=256)
+def parse_options(options: str) -> tuple[tuple[str, object], ...]:
+    """Parse an option string of the template filters, e.g. 'size=lg,no_tooltip'"""
+    extra = {}
+    for option in options.split(','):
+        parts = option.split('=', 1)
+        name, val = parts if len(parts) == 2 else (parts[0], True)
+        extra[name] = val
+    return tuple(extra.items())
+
+
 def render_as_button(
         colortag: "ColorTag",
         extra: Optional[dict[str, object]] = None
         ):
-    options = {
-        'active': getattr(colortag, 'is_active', False),
-        'element': 'span',
-        # 'tooltip_trigger': 'hover',
-        # 'tooltip_placement': 'top',
-        # 'size': 'xs',
-        'badge': True,
-        'button': True,
-    }
-    if extra:
-        options.update(extra)
+    return _render_compiled(colortag, extra or ())
+
+
+@instrument('render', counts=lambda html, *args: {'tags': 1}, cache=get_render_cache)
+def _render_compiled(colortag: "ColorTag", extra) -> str:
+    opts = compile_options(extra, getattr(colortag, 'is_active', False))
+    return _render_cached(colortag, opts, _render_cache_key(colortag, opts))
+
+
+def _render_cached(colortag: "ColorTag", opts: ButtonOptions, key: Optional[tuple]) -> str:
+    render = _render_fast if use_fast_render() else _render_as_button
+    cache = get_render_cache()
+    if key is None or cache.maxsize <= 0:
+        return render(colortag, opts)
 
-    if options.get('static'):
-        options['active'] = True
-        options['button'] = False
+    html = cache.get(key)
+    if html is not None:
+        return html
 
-    attrs = get_colortag_attrs(colortag, options)
-    classes = get_colortag_classes(colortag, options)
-    attrs['class'] = ' '.join(classes)
-    attrs['style'] = '--colortag-color: {}; '.format(colortag.color)
+    backend_alias = getattr(settings, 'COLORTAG_RENDER_CACHE_BACKEND', None)
+    if backend_alias:
+        backend = caches[backend_alias]
+        backend_key = 'colortag:render:' + hashlib.sha1(repr(key).encode()).hexdigest()
+        html = backend.get(backend_key)
+        if html is None:
+            html = render(colortag, opts)
+            backend.set(backend_key, html)
+    else:
+        html = render(colortag, opts)
+    cache.set(key, html)
+    return html
+
+
+def _render_as_button(colortag: "ColorTag", opts: ButtonOptions):
+    attrs = {'data-tagid': colortag.id}
+    if not opts.compact:
+        attrs['data-tagslug'] = colortag.slug
+        attrs['data-background'] = '{}'.format(colortag.color)
+    if opts.tooltip is not None and colortag.description:
+        attrs.update(opts.tooltip)
+        attrs['title'] = colortag.description
+    attrs['class'] = opts.class_string(colortag)
+    if not opts.compact:
+        attrs['style'] = '--colortag-color: {}; '.format(colortag.color)
 
     for k, v in getattr(colortag, 'data_attrs', {}).items():
         attrs['data-tag{}'.format(k)] = v
 
     return format_html('<{element} {attrs}>{name}</{element}>',
-                       element=options['element'],
+                       element=opts.element,
                        name=colortag.name,
                        attrs=flatatt(attrs))
 
 
+def _is_plain(value: object) -> bool:
+    # flatatt() drops None values and renders booleans without a value
+    return value is not None and value.__class__ is not bool
+
+
+def _render_fast(colortag: "ColorTag", opts: ButtonOptions):
+    """
+    Render the same HTML as _render_as_button() in a single string formatting
+    pass, escaping every tag field once. Falls back to _render_as_button() for
+    tags with data attributes and for unusual attribute values.
+    """
+    templates = opts._templates
+    if (templates is None
+            or getattr(colortag, 'data_attrs', None)
+            or not _is_plain(colortag.id)
+            or not _is_plain(colortag.slug)
+            or not _is_plain(colortag.color)):
+        return _render_as_button(colortag, opts)
+
+    description = colortag.description
+    if description and opts.tooltip is not None:
+        if not _is_plain(description):
+            return _render_as_button(colortag, opts)
+        template = templates[1]
+    else:
+        template = templates[0]
+
+    color = escape(colortag.color)
+    values = [
+        escape(opts.class_string(colortag)),
+        color,
+        escape(colortag.id),
+        conditional_escape(colortag.slug),
+        color,
+    ]
+    if template is templates[1]:
+        values.append(conditional_escape(description))
+    values.append(conditional_escape(colortag.name))
+    return mark_safe(template % tuple(values))
+
+
+def render_many(tags: Iterable["ColorTag"], separator: str = ' ', **options) -> str:
+    """
+    Render badges of many tags, joined with the separator, in one pass.
+    The options are those of render_as_button, rendering static badges by
+    default. Identical tags are rendered only once.
+    """
+    return _render_many(tags, (('static', True),) + tuple(options.items()), separator)
+
+
+def _count_tags(result, tags, *args) -> dict[str, int]:
+    return {'tags': len(tags)} if hasattr(tags, '__len__') else {}
+
+
+@instrument('render_many', counts=_count_tags, cache=get_render_cache)
+def _render_many(tags: Iterable["ColorTag"], extra, separator: str) -> str:
+    opts_by_active = {}
+    rendered = {}
+    parts = []
+    for tag in tags:
+        active = getattr(tag, 'is_active', False)
+        opts = opts_by_active.get(active)
+        if opts is None:
+            opts = opts_by_active[active] = compile_options(extra, active)
+        key = _render_cache_key(tag, opts)
+        if key is None:
+            parts.append(_render_cached(tag, opts, key))
+            continue
+        html = rendered.get(key)
+        if html is None:
+            html = rendered[key] = _render_cached(tag, opts, key)
+        parts.append(html)
+    return mark_safe(conditional_escape(separator).join(parts))
+
+
 @register.filter
 def colortag_button(colortag, options=''):
-    extra = {}
-    for option in options.split(','):
-        parts = option.split('=', 1)
-        name, val = parts if len(parts) == 2 else (parts[0], True)
-        extra[name] = val
-
-    return render_as_button(colortag, extra)
+    return _render_compiled(colortag, parse_options(options))
 
 
 @register.filter
 def colortag(colortag, options=''):
-    extra = {'static': True}
-    for option in options.split(','):
-        parts = option.split('=', 1)
-        name, val = parts if len(parts) == 2 else (parts[0], True)
-        extra[name] = val
+    return _render_compiled(colortag, (('static', True),) + parse_options(options))
+
+
+@register.simple_tag
+def colortags(tags, options='', separator=' '):
+    """Render badges of a list of tags, e.g. {% colortags item.tags.all "size=lg" %}"""
+    return _render_many(tags, (('static', True),) + parse_options(options), separator)
+
+
+@register.simple_tag
+def colortag_refs(tags, options=''):
+    """
+    Render placeholders with only the ids of the tags (or of tag ids), which
+    django_colortag_expand() in django_colortag.js replaces with badges.
+    """
+    return format_html_join(
+        '',
+        '<span class="colortag-ref" data-tagid="{}" data-options="{}"></span>',
+        ((getattr(tag, 'pk', tag), options) for tag in tags),
+    )
+
+
+@register.simple_tag
+def colortag_style(tags):
+    """Render a <style> block with the colors of the tags rendered with the compact option"""
+    return format_html('<style>{}</style>', mark_safe(render_stylesheet(tags)))
+
 
-    return render_as_button(colortag, extra)
+@register.simple_tag
+def colortag_stylesheet_link(url, tags):
+    """
+    Render a link to a TagStylesheetView with the content hash of the
+    stylesheet in the URL, so that the browser can cache it permanently.
+    """
+    version = stylesheet_version(render_stylesheet(tags))
+    return format_html('<link rel="stylesheet" href="{}?v={}">', url, version)
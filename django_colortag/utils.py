@@ -1,3 +1,19 @@
+from functools import lru_cache
+from typing import Iterable
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Luma coefficients for red, green and blue:
+#  ref: https://en.wikipedia.org/wiki/Luma_(video)#Rec._601_luma_versus_Rec._709_luma_coefficients
+_CCIR_601 = (0.299, 0.587, 0.114)
+# ITU-R, BT. 709 (W3C recommendation)
+_BT_709 = (0.2126, 0.7152, 0.0722)
+
+
 def _rgb_from_hexcode(color):
     color = color.lstrip('#')
     chars = len(color)
@@ -22,6 +38,15 @@ def _srgb_to_rgb(color):
         return ((value + 0.055) / 1.055) ** 2.4
 
 
+# Linear value of every 8-bit sRGB channel value
+_SRGB_TO_LINEAR = tuple(_srgb_to_rgb('{:02x}'.format(i)) for i in range(256))
+
+
+def _channels_from_hexcode(color):
+    return [int(channel, 16) for channel in _rgb_from_hexcode(color)]
+
+
+@lru_cache(maxsize=4096)
 def luminance(color, *, ccir=False):
     """
     Return relative luminance of a color code given in hex.
@@ -29,18 +54,38 @@ def luminance(color, *, ccir=False):
     W3C relative luminance definition:
       https://www.w3.org/TR/WCAG20/#relativeluminancedef
     """
-    rgb = _rgb_from_hexcode(color)
-    r, g, b = [_srgb_to_rgb(channel) for channel in rgb]
-    if ccir:
-        # CCIR 601:
-        return 0.299 * r + 0.587 * g + 0.114 * b
+    r, g, b = [_SRGB_TO_LINEAR[channel] for channel in _channels_from_hexcode(color)]
+    cr, cg, cb = _CCIR_601 if ccir else _BT_709
+    return cr * r + cg * g + cb * b
+
+
+def luminance_many(colors: Iterable[str], *, ccir=False) -> list[float]:
+    """
+    Return relative luminances of a list of color codes given in hex.
+
+    Every distinct color is parsed only once. The channel conversion is
+    vectorized when NumPy is installed.
+    """
+    colors = list(colors)
+    unique = list(dict.fromkeys(colors))
+    if numpy is None or len(unique) < 2:
+        values = {color: luminance(color, ccir=ccir) for color in unique}
     else:
-        # ITU-R, BT. 709 (W3C recommendation
-        return 0.2126 * r + 0.7152 * g + 0.0722 * b
-    # ref: https://en.wikipedia.org/wiki/Luma_(video)#Rec._601_luma_versus_Rec._709_luma_coefficients
+        channels = numpy.array([_channels_from_hexcode(color) for color in unique])
+        linear = numpy.array(_SRGB_TO_LINEAR)[channels]
+        cr, cg, cb = _CCIR_601 if ccir else _BT_709
+        # Same operation order as luminance() to get identical results
+        result = cr * linear[:, 0] + cg * linear[:, 1] + cb * linear[:, 2]
+        values = dict(zip(unique, result.tolist()))
+    return [values[color] for color in colors]
 
 
 def use_white_font(color, *, threshold=0.17913, **kwargs):
     # Based on W3C recommendation:
     #  sqrt(1.05 * 0.05) - 0.05 ~= 0.17913
     return luminance(color, **kwargs) <= threshold
+
+
+def use_white_font_many(colors: Iterable[str], *, threshold=0.17913, **kwargs) -> list[bool]:
+    """Return use_white_font() for each color of a list"""
+    return [value <= threshold for value in luminance_many(colors, **kwargs)]
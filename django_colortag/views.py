@@ -0,0 +1,240 @@
+import hashlib
+import json
+
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.text import slugify
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+from django.views import View
+
+from .cache import bump_tags_version, cached_tag_list
+from .index import update_tag_indexes
+from .stylesheet import render_stylesheet, stylesheet_version
+
+
+def bulk_create_taggings(model, tag, object_ids, *, tag_field='tag', object_field='user', **defaults):
+    """
+    Tag all objects with a single INSERT, ignoring the existing taggings.
+    model is the tagging model with foreign keys tag_field to the tag and
+    object_field to the tagged object. Extra field values are given as
+    keyword arguments. As bulk_create sends no signals, the tag index fields
+    and the tags version (see cached_result_pks) of the tagged objects are
+    updated here. Returns the number of distinct object ids.
+    """
+    object_field = model._meta.get_field(object_field)
+    object_ids = list(dict.fromkeys(object_ids))
+    taggings = [
+        model(**{tag_field: tag, object_field.attname: object_id}, **defaults)
+        for object_id in object_ids
+    ]
+    model._default_manager.bulk_create(taggings, ignore_conflicts=True)
+    update_tag_indexes(model, object_field.related_model, object_ids)
+    bump_tags_version(model)
+    bump_tags_version(object_field.related_model)
+    return len(taggings)
+
+
+class BulkTaggingView(View):
+    """
+    Tag many objects with one request. Expects a JSON POST body like
+    {"tag": {"slug": "urgent"}, "ids": [1, 2, 3]}.
+
+    Subclasses set tagging_model and implement get_tag_queryset() and
+    get_object_queryset(), the objects the user may tag. Ids missing from
+    it are answered with 400. Fields of the taggings may be added in
+    get_tagging_defaults().
+    """
+    http_method_names = ['post']
+    tagging_model = None
+    tag_field = 'tag'
+    object_field = 'user'
+    max_ids = 1000
+
+    def get_tag_queryset(self):
+        raise NotImplementedError("Subclasses must return the queryset of taggable tags")
+
+    def get_object_queryset(self):
+        raise NotImplementedError("Subclasses must return the queryset of taggable objects")
+
+    def get_tagging_defaults(self):
+        return {}
+
+    def has_permission(self):
+        return self.request.user.is_staff
+
+    def post(self, request, *args, **kwargs):
+        if not self.has_permission():
+            raise PermissionDenied
+        try:
+            data = json.loads(request.body)
+            slug = data['tag']['slug']
+            object_ids = data['ids']
+            # Not int(), which would turn true, 1.9 and "1" into 1
+            if not isinstance(object_ids, list) or not all(
+                isinstance(object_id, int) and not isinstance(object_id, bool) for object_id in object_ids
+            ):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'detail': "Expected a tag slug and a list of ids"}, status=400)
+        if len(object_ids) > self.max_ids:
+            return JsonResponse({'detail': "At most {} ids are allowed".format(self.max_ids)}, status=400)
+
+        tag = get_object_or_404(self.get_tag_queryset(), slug=slug)
+        found = set(self.get_object_queryset().filter(pk__in=object_ids).values_list('pk', flat=True))
+        unknown = [object_id for object_id in dict.fromkeys(object_ids) if object_id not in found]
+        if unknown:
+            return JsonResponse({'detail': "Unknown ids", 'ids': unknown}, status=400)
+        count = bulk_create_taggings(
+            self.tagging_model,
+            tag,
+            object_ids,
+            tag_field=self.tag_field,
+            object_field=self.object_field,
+            **self.get_tagging_defaults(),
+        )
+        return JsonResponse({'tag': {'id': tag.pk, 'slug': tag.slug}, 'count': count}, status=201)
+
+
+def tag_catalog_data(tags):
+    """Return the fields of the tags used by django_colortag_badge in JS"""
+    data = []
+    for tag in tags:
+        item = {
+            'id': tag.pk,
+            'slug': tag.slug,
+            'name': tag.name,
+            'color': tag.color,
+            'description': tag.description,
+            'font_white': tag.font_white,
+        }
+        data_attrs = getattr(tag, 'data_attrs', None)
+        if data_attrs:
+            item['data-attrs'] = data_attrs
+        data.append(item)
+    return data
+
+
+class TagCatalogView(View):
+    """
+    Serve a set of tags as JSON for rendering them in the browser, see
+    django_colortag_expand() in django_colortag.js. The response has a content
+    hash ETag, so unchanged catalogs are answered with 304 Not Modified.
+
+    Subclasses implement get_queryset().
+    """
+    http_method_names = ['get', 'head']
+    max_age = 60
+
+    def get_queryset(self):
+        raise NotImplementedError("Subclasses must return the queryset of the tags")
+
+    def get(self, request, *args, **kwargs):
+        body = json.dumps(
+            {'tags': tag_catalog_data(cached_tag_list(self.get_queryset()))},
+            separators=(',', ':'),
+        ).encode()
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=self.max_age)
+        return response
+
+
+class TagStylesheetView(View):
+    """
+    Serve the CSS of the tags rendered with the compact option. Requested
+    with the content hash as the parameter v (see the template tag
+    colortag_stylesheet_link), the response may be cached permanently.
+    Otherwise it has a content hash ETag like TagCatalogView.
+
+    Subclasses implement get_queryset().
+    """
+    http_method_names = ['get', 'head']
+    max_age = 60
+    immutable_max_age = 365 * 24 * 60 * 60
+
+    def get_queryset(self):
+        raise NotImplementedError("Subclasses must return the queryset of the tags")
+
+    def get(self, request, *args, **kwargs):
+        css = render_stylesheet(cached_tag_list(self.get_queryset()))
+        version = stylesheet_version(css)
+        etag = '"{}"'.format(version)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(css, content_type='text/css')
+        response['ETag'] = etag
+        if request.GET.get('v') == version:
+            patch_cache_control(response, private=True, max_age=self.immutable_max_age, immutable=True)
+        else:
+            patch_cache_control(response, private=True, max_age=self.max_age)
+        return response
+
+
+class TagSearchView(View):
+    """
+    Search tags by any part of their slug or name (match = 'contains') or by
+    the start of their slug in any case (match = 'prefix', the query
+    slugified), for autocompleting large tag sets.
+    GET parameters: q, the search text, and page, starting from 1. Returns
+    {"results": [tags as in TagCatalogView], "next": next page or null},
+    tags matching from the start first. Prefix matches are ordered by the
+    lowercased slug.
+
+    Subclasses implement get_queryset().
+    """
+    http_method_names = ['get', 'head']
+    match = 'contains'
+    page_size = 20
+    max_query_length = 100
+    max_age = 30
+
+    def get_queryset(self):
+        raise NotImplementedError("Subclasses must return the queryset of the tags")
+
+    def search(self, queryset, query):
+        if not query:
+            return queryset.order_by('name', 'pk')
+        if self.match == 'prefix':
+            # A case-sensitive LIKE on the lowercased slug, which an index of
+            # Lower('slug') can serve, unlike the UPPER() of istartswith
+            slug = slugify(query)
+            if not slug:
+                return queryset.none()
+            return (
+                queryset
+                .alias(colortag_slug=Lower('slug'))
+                .filter(colortag_slug__startswith=slug)
+                .order_by('colortag_slug', 'pk')
+            )
+        prefix = Q(slug__istartswith=query) | Q(name__istartswith=query)
+        return (
+            queryset
+            .filter(Q(slug__icontains=query) | Q(name__icontains=query))
+            .annotate(colortag_rank=Case(
+                When(prefix, then=Value(0)), default=Value(1), output_field=IntegerField(),
+            ))
+            .order_by('colortag_rank', 'name', 'pk')
+        )
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()[:self.max_query_length]
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            return JsonResponse({'detail': "Invalid page"}, status=400)
+
+        start = (page - 1) * self.page_size
+        # One extra row tells whether there is a next page without a count query
+        tags = list(self.search(self.get_queryset(), query)[start:start + self.page_size + 1])
+        response = JsonResponse({
+            'results': tag_catalog_data(tags[:self.page_size]),
+            'next': page + 1 if len(tags) > self.page_size else None,
+        })
+        patch_cache_control(response, private=True, max_age=self.max_age)
+        return response
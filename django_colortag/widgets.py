@@ -1,3 +1,5 @@
+import copy
+import re
 from collections.abc import Iterable
 from itertools import chain
 from typing import (
@@ -5,10 +7,17 @@ from typing import (
     Optional,
 )
 
+from django.conf import settings
 from django.forms import widgets
 from django.utils.encoding import force_str
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
+from .cache import LRUCache
+from .instrumentation import instrument
+from .stylesheet import tag_class
+
 
 def get_colortag_attrs(colortag, options):
     attrs = {
@@ -114,6 +123,31 @@ class ColortagSelectMultiple(ColortagMixIn, widgets.CheckboxSelectMultiple):
         return groups
 
 
+def get_include_exclude_attrs(tag, attrs=None, compact=False):
+    opts = { 'button': True }
+    if attrs == None:
+        attrs = {}
+    tag_attrs = get_colortag_attrs(tag, opts)
+    classes = get_colortag_classes(tag, opts)
+    if compact:
+        # The color comes from the generated stylesheet, see stylesheet.py
+        del tag_attrs['data-tagslug'], tag_attrs['data-background']
+        classes.add(tag_class(tag))
+    attrs.update(tag_attrs)
+    if not compact:
+        attrs['style'] = f"--colortag-color: {tag.color};"
+    attrs['data-class'] = ' '.join(classes)
+    return attrs
+
+
+def get_include_exclude_choices(tag):
+    return [
+        ('', tag.name),
+        ('I' + str(tag.pk), tag.name),
+        ('E' + str(tag.pk), tag.name),
+    ]
+
+
 class ColortagIncludeExcludeWidget(ColortagMixIn, widgets.RadioSelect):
     class_name = 'colortag-inc-exc'
     template_name = "django_colortag/widgets/inc_exc_group.html"
@@ -122,20 +156,10 @@ class ColortagIncludeExcludeWidget(ColortagMixIn, widgets.RadioSelect):
     def __init__(self,
                  attrs: Optional[dict[str, object]] = None,
                  tag: Optional["ColorTag"] = None,
+                 compact: bool = False,
                 ) -> None:
         assert tag, "The choice must be defined"
-        opts = { 'button': True }
-        if attrs == None:
-            attrs = {}
-        attrs.update(get_colortag_attrs(tag, opts))
-        attrs['style'] = f"--colortag-color: {tag.color};"
-        attrs['data-class'] = ' '.join(get_colortag_classes(tag, opts))
-        choices = [
-            ('', tag.name),
-            ('I' + str(tag.pk), tag.name),
-            ('E' + str(tag.pk), tag.name),
-        ]
-        super().__init__(attrs, choices)
+        super().__init__(get_include_exclude_attrs(tag, attrs, compact), get_include_exclude_choices(tag))
 
     def create_option(self,
                       name: str,
@@ -170,32 +194,220 @@ class ColortagIncludeExcludeWidget(ColortagMixIn, widgets.RadioSelect):
         return option
 
 
+class ColortagIncludeExcludeSpec:
+    """
+    The tag and attributes of a ColortagIncludeExcludeWidget, which is built
+    only when the widget is needed for rendering.
+    """
+    __slots__ = ('tag', 'attrs', 'compact')
+
+    def __init__(self,
+                 tag: "ColorTag",
+                 attrs: Optional[dict[str, object]] = None,
+                 compact: bool = False,
+                 ) -> None:
+        self.tag = tag
+        self.attrs = attrs
+        self.compact = compact
+
+    def build(self) -> ColortagIncludeExcludeWidget:
+        attrs = None if self.attrs is None else dict(self.attrs)
+        return ColortagIncludeExcludeWidget(attrs, self.tag, self.compact)
+
+    def widget_attrs(self) -> dict[str, object]:
+        """Return the attrs the built widget would have"""
+        attrs = get_include_exclude_attrs(
+            self.tag, None if self.attrs is None else dict(self.attrs), self.compact,
+        )
+        class_name = ColortagIncludeExcludeWidget.class_name
+        if 'class' in attrs:
+            attrs['class'] += ' ' + class_name
+        else:
+            attrs['class'] = class_name
+        return attrs
+
+
+def _flatatt(attrs: dict[str, object]) -> str:
+    # Same output as the template django/forms/widgets/attrs.html
+    return ''.join(
+        ' {}{}'.format(
+            conditional_escape(name),
+            '' if value is True else '="{}"'.format(conditional_escape(value)),
+        )
+        for name, value in attrs.items() if value is not False
+    )
+
+
+# Rendered include/exclude groups without the selection state
+_group_cache = LRUCache(4096)
+
+
+def _render_group(name: str, input_type: str, attrs: dict[str, object], choices: list) -> tuple:
+    """
+    Return the HTML of an include/exclude group as it is rendered by the
+    templates inc_exc_group.html and inc_exc_option.html, split into
+    (group start, ((value, option start, option end, label head), ...)).
+    The checked attribute of the selected option goes between the option
+    start and end. The label head is the option end up to the label, before
+    _strip_spaces_between_tags(), for inserting a count after the label.
+    """
+    options = []
+    for value, label in choices:
+        option_id = attrs['id']
+        if not value:
+            add_class = "inactive"
+            option_id += '_?'
+        elif value[0] == 'I':
+            add_class = "include active"
+            option_id += '_i'
+        elif value[0] == "E":
+            add_class = "exclude active"
+            option_id += '_e'
+        if 'data-class' in attrs:
+            add_class += " " + attrs['data-class']
+        cls = conditional_escape(add_class)
+        option_id = conditional_escape(option_id)
+        start = '<input type="{}" name="{}"\n\tclass="btn-check"\n\t value="{}"\n'.format(
+            conditional_escape(input_type), conditional_escape(name), conditional_escape(value),
+        )
+        label_head = ' class="{cls}" id="{id}"><label\n\t class="{cls}"\n\t for="{id}"\n>\n\t{label}'.format(
+            cls=cls, id=option_id, label=conditional_escape(label),
+        )
+        end = _strip_spaces_between_tags(label_head + '\n</label>')
+        options.append((str(value), start, end, label_head))
+    return ('<div ' + _flatatt(attrs) + '>', tuple(options))
+
+
+def _tag_pk(attrs: dict[str, object]) -> object:
+    # The pk of the tag of an include/exclude group, see get_colortag_attrs()
+    return attrs.get('data-tagid')
+
+
+def _strip_spaces_between_tags(value: str) -> str:
+    return re.sub(r'>\s+<', '><', value)
+
+
 class ColortagIEMultiWidget(widgets.MultiWidget):
     template_name = "django_colortag/widgets/colortag_multiwidget.html"
+    direct_template_name = "django_colortag/widgets/colortag_multiwidget_direct.html"
     class_name = 'colortag-ie-group'
+    # Render the tags directly in Python instead of through the templates.
+    # None follows the setting COLORTAG_DIRECT_WIDGET_RENDER.
+    direct_render = None
+    # A callable returning the number of results by tag pk, shown after the
+    # tag names, see set_facet_counts()
+    facet_counts = None
+    # Leave the tag colors to the generated stylesheet instead of a style per
+    # tag. None follows the setting COLORTAG_COMPACT_WIDGETS.
+    compact = None
 
     def __init__(self,
                  attrs: Optional[dict[str, object]] = None,
                  choices: Optional[Iterable["ColorTag"]] = None,
                 ) -> None:
-        widgets = {
-            c.slug: ColortagIncludeExcludeWidget(attrs, c) for c in choices
-        } if choices else []
-        super().__init__(widgets, attrs)
+        super().__init__({}, attrs)
         if 'class' in self.attrs:
             self.attrs['class'] += ' ' + self.class_name
         else:
             self.attrs['class'] = self.class_name
-
-    def set_subwidgets(self, choices: Iterable["ColorTag"]) -> None:
-        self.widgets = [ColortagIncludeExcludeWidget(tag=c) for c in choices]
+        if choices:
+            self._set_specs(choices, attrs)
+
+    def _set_specs(self,
+                   choices: Iterable["ColorTag"],
+                   attrs: Optional[dict[str, object]] = None,
+                   ) -> None:
+        # The subwidgets are built lazily from the specs, e.g. forms that are
+        # only validated never build them.
+        choices = list(choices)
+        compact = self.use_compact()
+        self._specs = tuple(ColortagIncludeExcludeSpec(c, attrs, compact) for c in choices)
+        self._widgets = None
         self.widgets_names = ['_%s' % c.slug for c in choices]
 
+    def set_subwidgets(self, choices: Iterable["ColorTag"]) -> None:
+        self._set_specs(choices)
+
+    def set_facet_counts(self, counts: Optional[Callable[[], dict[object, int]]]) -> None:
+        """
+        Show counts after the tag names. counts is called once per rendering
+        and returns a dict of the counts by tag pk, missing tags having 0.
+        """
+        self.facet_counts = counts
+
+    def get_facet_counts(self) -> Optional[dict[object, int]]:
+        return self.facet_counts() if self.facet_counts is not None else None
+
+    @property
+    def widgets(self) -> "list[widgets.Widget]":
+        if self._widgets is None:
+            self._widgets = [spec.build() for spec in self._specs]
+        return self._widgets
+
+    @widgets.setter
+    def widgets(self, value: "Iterable[widgets.Widget]") -> None:
+        self._specs = ()
+        self._widgets = list(value)
+
+    def __deepcopy__(self, memo):
+        obj = widgets.Widget.__deepcopy__(self, memo)
+        if self._widgets is not None:
+            obj._widgets = copy.deepcopy(self._widgets, memo)
+        return obj
+
+    @property
+    def is_hidden(self) -> bool:
+        if self._widgets is None:
+            return not self._specs
+        return super().is_hidden
+
+    @property
+    def needs_multipart_form(self) -> bool:
+        if self._widgets is None:
+            return False
+        return super().needs_multipart_form
+
+    @property
+    def media(self) -> "widgets.Media":
+        if self._widgets is None:
+            return widgets.Media()
+        return self._get_media()
+
+    def value_from_datadict(self, data, files, name):
+        if self._widgets is None:
+            # Same as RadioSelect.value_from_datadict of every subwidget
+            return [data.get(name + widget_name) for widget_name in self.widgets_names]
+        return super().value_from_datadict(data, files, name)
+
+    def value_omitted_from_data(self, data, files, name):
+        if self._widgets is None:
+            return all(name + widget_name not in data for widget_name in self.widgets_names)
+        return super().value_omitted_from_data(data, files, name)
+
+    def use_compact(self) -> bool:
+        if self.compact is None:
+            return getattr(settings, 'COLORTAG_COMPACT_WIDGETS', False)
+        return self.compact
+
+    def use_direct_render(self) -> bool:
+        if self.direct_render is None:
+            return getattr(settings, 'COLORTAG_DIRECT_WIDGET_RENDER', False)
+        return self.direct_render
+
+    def render(self, name, value, attrs=None, renderer=None):
+        context = self.get_context(name, value, attrs)
+        return self._render(context['widget']['template_name'], context, renderer)
+
+    @instrument('widget', counts=lambda context, self, *args: {'tags': len(self.widgets_names)}, queries=True)
     def get_context(self,
                     name: str,
                     value: Iterable,
                     attrs: Optional[dict[str, object]],
                     ) -> dict[str, object]:
+        if self.use_direct_render():
+            context = self.get_direct_context(name, value, attrs)
+            if context is not None:
+                return context
         context = widgets.Widget.get_context(self, name, value, attrs)
         if self.is_localized:
             for widget in self.widgets:
@@ -208,6 +420,7 @@ class ColortagIEMultiWidget(widgets.MultiWidget):
         final_attrs = context["widget"]["attrs"]
         input_type = final_attrs.pop("type", None)
         id_ = context["widget"]["attrs"].get("id")
+        counts = self.get_facet_counts()
         subwidgets = []
         for i, (widget_name, widget) in enumerate(
             zip(self.widgets_names, self.widgets)
@@ -222,12 +435,86 @@ class ColortagIEMultiWidget(widgets.MultiWidget):
             widget_attrs = widget.attrs
             if id_:
                 widget_attrs["id"] = "%s_%s" % (id_, i)
-            subwidgets.append(
-                widget.get_context(widget_name, widget_value, widget_attrs)["widget"]
-            )
+            subwidget = widget.get_context(widget_name, widget_value, widget_attrs)["widget"]
+            if counts is not None:
+                count = counts.get(_tag_pk(widget.attrs), 0)
+                for group, options, index in subwidget["optgroups"]:
+                    for option in options:
+                        option["count"] = count
+            subwidgets.append(subwidget)
         context["widget"]["subwidgets"] = subwidgets
         return context
 
+    def get_direct_context(self,
+                           name: str,
+                           value: Iterable,
+                           attrs: Optional[dict[str, object]],
+                           ) -> Optional[dict[str, object]]:
+        """
+        Return a context with the whole widget HTML rendered in Python, or
+        None if the widget can not be rendered without the templates.
+        The markup is the same as the templates produce.
+        """
+        context = widgets.Widget.get_context(self, name, value, attrs)
+        final_attrs = context["widget"]["attrs"]
+        input_type = final_attrs.pop("type", None)
+        id_ = final_attrs.get("id")
+        if not id_:
+            return None
+        if self._widgets is None:
+            sources = [(spec.widget_attrs(), get_include_exclude_choices(spec.tag)) for spec in self._specs]
+        elif all(type(w) is ColortagIncludeExcludeWidget for w in self._widgets):
+            sources = [(dict(w.attrs), list(w.choices)) for w in self._widgets]
+        else:
+            return None
+
+        if value == None:
+            value = [None] * len(sources)
+        counts = self.get_facet_counts()
+        groups = []
+        for i, (widget_name, (widget_attrs, choices)) in enumerate(zip(self.widgets_names, sources)):
+            widget_attrs["id"] = "%s_%s" % (id_, i)
+            group_name = name + widget_name
+            group_type = input_type or ColortagIncludeExcludeWidget.input_type
+            try:
+                key = (group_name, group_type, tuple(widget_attrs.items()), tuple(choices))
+                group = _group_cache.get(key)
+            except TypeError:
+                key = group = None
+            if group is None:
+                group = _render_group(group_name, group_type, widget_attrs, choices)
+                if key is not None:
+                    _group_cache.set(key, group)
+
+            try:
+                selected = value[i]
+            except IndexError:
+                selected = None
+            selected = '' if selected is None else str(selected)
+            start, options = group
+            groups.append(start)
+            if counts is not None:
+                count_html = ' <span class="colortag-count">{}</span>\n</label>'.format(
+                    conditional_escape(counts.get(_tag_pk(widget_attrs), 0))
+                )
+            has_selected = False
+            for option_value, option_start, option_end, label_head in options:
+                groups.append(option_start)
+                if not has_selected and option_value == selected:
+                    has_selected = True
+                    groups.append(' checked')
+                if counts is not None:
+                    option_end = _strip_spaces_between_tags(label_head + count_html)
+                groups.append(option_end)
+            groups.append('</div>')
+
+        # Same whitespace as colortag_multiwidget.html and multiwidget.html
+        context["widget"]["template_name"] = self.direct_template_name
+        context["widget"]["html"] = mark_safe(
+            '<div ' + _flatatt(final_attrs) + '>\n  ' + ''.join(groups) + '\n\n</div>\n'
+        )
+        return context
+
     def decompress(self, value):
         if value == None:
             return [None for w in self.widgets]
@@ -323,6 +610,9 @@ class ColortagIEAndOrWidget(widgets.MultiWidget):
     def set_subwidgets(self, choices):
         self.widgets[1].set_subwidgets(choices)
 
+    def set_facet_counts(self, counts):
+        self.widgets[1].set_facet_counts(counts)
+
     def decompress(self, value):
         if value == None:
             return [None, None]
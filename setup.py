@@ -51,7 +51,7 @@ setup(
         'Programming Language :: Python :: 3 :: Only',
     ],
 
-    packages=find_packages(exclude=['contrib', 'docs', 'tests']),
+    packages=find_packages(exclude=['contrib', 'docs', 'tests', 'benchmarks', 'benchmarks.*']),
     include_package_data = True,
 
     install_requires=[